@@ -0,0 +1,149 @@
+'''
+    Benchmark suite of the connector against the local stand-in API (see
+    server.py), without network access. For each case it reports the wall
+    time (best of --repeat), the throughput, the p50/p95 latency of the
+    requests (from the connector metrics) and the peak memory (tracemalloc,
+    in a separate run). The stand-in API runs in a child process.
+
+    Usage: python benchmarks/api.py --latency 0.02 --repeat 3
+           python benchmarks/api.py --only get_data --json results.json
+'''
+from server import StandInAPI
+from contextlib import redirect_stdout
+import argparse
+import io
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+
+api = StandInAPI()
+# Before importing the connector, the API url is read on import
+os.environ['API_URL'] = api.start()
+os.environ['SC_BEARER'] = 'benchmark'
+
+from smartcitizen_connector import SCDevice, get_world_map, search_by_query
+from smartcitizen_connector.metrics import metrics
+from smartcitizen_connector.tools import set_logger_level
+import logging
+import numpy as np
+import pandas as pd
+
+def bench_init(devices = 20):
+    for id in range(1, devices + 1):
+        SCDevice(id)
+    return devices, 'devices'
+
+def bench_get_data(sensors = 5, rows = 1440, output = 'pandas'):
+    api.configure(sensors = sensors, rows = rows)
+    device = SCDevice(1, check_postprocessing = False)
+    asyncio.run(device.get_data(min_date = '2024-01-01', output = output))
+    if output == 'pandas':
+        assert device.data.shape == (rows, sensors), device.data.shape
+    return rows * sensors, 'readings'
+
+def bench_post_data(sensors = 5, rows = 1440, combined = False):
+    api.configure(sensors = sensors)
+    device = SCDevice(1, check_postprocessing = False)
+    index = pd.date_range('2024-01-01', periods = rows, freq = '1min', tz = 'UTC')
+    device.data = pd.DataFrame({sensor.name: np.arange(rows, dtype = float)
+        for sensor in device.json.data.sensors}, index = index)
+    assert asyncio.run(device.post_data(combined = combined))
+    return rows * sensors, 'readings'
+
+def bench_world_map(devices = 10000):
+    api.configure(devices = devices)
+    assert len(get_world_map()) == devices
+    return devices, 'devices'
+
+def bench_search(devices = 2000, per_page = 100):
+    api.configure(devices = devices, per_page = per_page)
+    df = search_by_query('devices', [{'key': 'name', 'search_matcher': 'cont', 'value': 'Device'}])
+    assert len(df) == devices
+    return devices, 'devices'
+
+CASES = [
+    ('init', bench_init, {'devices': 20}),
+    ('get_data', bench_get_data, {'sensors': 1, 'rows': 1440}),
+    ('get_data', bench_get_data, {'sensors': 10, 'rows': 1440}),
+    ('get_data', bench_get_data, {'sensors': 5, 'rows': 10080}),
+    ('get_data', bench_get_data, {'sensors': 10, 'rows': 43200}),
+    ('get_data', bench_get_data, {'sensors': 10, 'rows': 43200, 'output': 'numpy'}),
+    ('get_data', bench_get_data, {'sensors': 10, 'rows': 43200, 'output': 'arrow'}),
+    ('post_data', bench_post_data, {'sensors': 5, 'rows': 10080}),
+    ('post_data', bench_post_data, {'sensors': 5, 'rows': 10080, 'combined': True}),
+    ('world_map', bench_world_map, {'devices': 10000}),
+    ('search', bench_search, {'devices': 2000, 'per_page': 100}),
+]
+
+def run(function, kwargs, repeat):
+    '''
+        Returns the best time of repeat runs, with the request metrics of the
+        best one, and the peak memory of an extra run
+    '''
+    settings = dict(api.settings)
+    best = None
+    # Progress bars are not part of the results
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            api.configure(**settings)
+            with metrics.collect() as aggregator:
+                start = time.perf_counter()
+                units, name = function(**kwargs)
+                elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, aggregator.totals())
+
+        api.configure(**settings)
+        tracemalloc.start()
+        function(**kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        api.configure(**settings)
+
+    elapsed, totals = best
+    return {
+        'time': elapsed,
+        'throughput': units / elapsed,
+        'unit': name,
+        'requests': totals['count'],
+        'retries': totals['retries'],
+        'latency_p50': totals['latency_p50'],
+        'latency_p95': totals['latency_p95'],
+        'peak_memory': peak / 2**20,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--latency', type = float, default = 0.02,
+        help = 'Seconds before each response of the stand-in API')
+    parser.add_argument('--throttle', type = float, default = None,
+        help = 'Requests per second before the stand-in API answers 429')
+    parser.add_argument('--only', nargs = '*', default = None,
+        help = 'Names of the cases to run')
+    parser.add_argument('--json', default = None,
+        help = 'File to save the results, to compare runs')
+    args = parser.parse_args()
+
+    set_logger_level(logging.ERROR)
+    api.configure(latency = args.latency, throttle = args.throttle)
+
+    results = list()
+    print(f'{"case":60} {"time":>8} {"throughput":>20} {"requests":>8} {"p50":>8} {"p95":>8} {"peak":>9}')
+    for name, function, kwargs in CASES:
+        if args.only and name not in args.only: continue
+        result = run(function, kwargs, args.repeat)
+        result.update(case = name, **kwargs)
+        results.append(result)
+        case = f'{name} ' + ' '.join(f'{key}={value}' for key, value in kwargs.items())
+        print(f'{case:60} {result["time"]:7.3f}s {result["throughput"]:10.0f} {result["unit"] + "/s":>9} '
+            f'{result["requests"]:8} {1000*result["latency_p50"]:6.1f}ms {1000*result["latency_p95"]:6.1f}ms '
+            f'{result["peak_memory"]:7.2f}MB')
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent = 2)
+
+    api.stop()
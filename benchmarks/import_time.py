@@ -0,0 +1,56 @@
+'''
+    Benchmark of the import time of the package, with python -X importtime.
+    Each statement runs in a fresh interpreter, several times, and the best
+    cumulative time of the smartcitizen_connector import is reported, with
+    the heavy dependencies that it loaded.
+
+    Usage: python benchmarks/import_time.py --runs 5
+'''
+import argparse
+import subprocess
+import sys
+
+STATEMENTS = [
+    'import smartcitizen_connector',
+    'from smartcitizen_connector import get_users',
+    'from smartcitizen_connector import search_by_query',
+    'from smartcitizen_connector import SCDevice',
+]
+
+HEAVY = ['pandas', 'numpy', 'aiohttp', 'requests', 'pydantic',
+    'tqdm', 'timezonefinder', 'pyarrow']
+
+def import_time(statement):
+    '''
+        Returns the cumulative import time (in seconds) of the package and
+        the set of top level modules imported by the statement
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+        capture_output = True, text = True, check = True)
+
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit(): continue
+        modules.add(name.strip().split('.')[0])
+        # Nested imports are indented. Add up the outermost package imports
+        # (the lazy subpackages are imported after the package itself)
+        if name == ' ' + name.strip() and name.strip().split('.')[0] == 'smartcitizen_connector':
+            total += int(cumulative) / 1e6
+
+    return total, modules
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type = int, default = 5)
+    args = parser.parse_args()
+
+    for statement in STATEMENTS:
+        times = list()
+        for _ in range(args.runs):
+            elapsed, modules = import_time(statement)
+            times.append(elapsed)
+        heavy = [module for module in HEAVY if module in modules]
+        print(f'{statement:55} {min(times):7.3f} s  {", ".join(heavy) or "-"}')
@@ -0,0 +1,55 @@
+'''
+    Benchmark of the merge of sensor DataFrames in SCDevice.get_data:
+    successive combine_first (before) vs. combine_frames (after).
+    Sensors report at different cadences, like in real devices.
+
+    Usage: python benchmarks/merge.py --sensors 30 --rows 100000
+'''
+from smartcitizen_connector.tools import combine_frames
+from pandas import DataFrame, date_range
+import numpy as np
+import argparse
+import tracemalloc
+import time
+
+def make_frames(sensors, rows):
+    frames = list()
+    index = date_range('2024-01-01', periods = rows, freq = 'min', tz = 'Europe/Madrid')
+    for n in range(sensors):
+        # Every sensor with its own cadence and gaps
+        step = 1 + n % 5
+        frames.append(DataFrame({f'SENSOR_{n}': np.random.rand(len(index[::step]))}, index = index[::step]))
+    return frames
+
+def fold(frames):
+    df = DataFrame()
+    for frame in frames:
+        df = df.combine_first(frame)
+    return df
+
+def measure(function, frames):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(frames)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type = int, default = 30)
+    parser.add_argument('--rows', type = int, default = 100000)
+    args = parser.parse_args()
+
+    frames = make_frames(args.sensors, args.rows)
+
+    before, before_time, before_peak = measure(fold, frames)
+    after, after_time, after_peak = measure(combine_frames, frames)
+
+    assert before.equals(after)
+
+    print(f'{args.sensors} sensors x {args.rows} rows')
+    print(f'combine_first:  {before_time:8.3f} s  peak {before_peak/1e6:8.1f} MB')
+    print(f'combine_frames: {after_time:8.3f} s  peak {after_peak/1e6:8.1f} MB')
+    print(f'speedup: {before_time/after_time:.1f}x')
@@ -0,0 +1,68 @@
+'''
+    Benchmark of the readings ingestion of get_data for each output format,
+    without the network: the responses of the stand-in API (see server.py)
+    are recorded once in an archive and replayed, so only the decoding and
+    building of the data is measured.
+
+    Usage: python benchmarks/readings.py --sensors 10 --rows 43200 --slow-sensors 6 --repeat 3
+'''
+from server import StandInAPI
+from tempfile import TemporaryDirectory
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+CASES = [
+    ('pandas', {}),
+    ('pandas keep_utc', {'keep_utc': True}),
+    ('numpy', {'output': 'numpy'}),
+    ('arrow', {'output': 'arrow'}),
+    ('pandas float32', {'compact': 'float32'}),
+    ('pandas sparse', {'compact': 'sparse'}),
+]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type = int, default = 10)
+    parser.add_argument('--rows', type = int, default = 43200)
+    parser.add_argument('--slow-sensors', type = int, default = 0,
+        help = 'Sensors with one reading every 10 minutes only')
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    api = StandInAPI(sensors = args.sensors, rows = args.rows, slow_sensors = args.slow_sensors)
+    os.environ['API_URL'] = api.start()
+
+    from smartcitizen_connector import SCDevice, HttpArchive
+    from smartcitizen_connector.client import client
+    from smartcitizen_connector.tools import set_logger_level
+    import logging
+    set_logger_level(logging.ERROR)
+
+    with TemporaryDirectory() as directory:
+        client.archive = HttpArchive(os.path.join(directory, 'readings.jsonl.gz'), 'record')
+        device = SCDevice(1, check_postprocessing = False)
+        asyncio.run(device.get_data(min_date = '2024-01-01'))
+        client.archive.close()
+        api.stop()
+        client.archive = HttpArchive(client.archive.path, 'replay')
+
+        print(f'{args.sensors} sensors ({args.slow_sensors} slow) x {args.rows} readings (replayed)')
+        for name, kwargs in CASES:
+            elapsed = list()
+            for _ in range(args.repeat):
+                device = SCDevice(1, check_postprocessing = False)
+                start = time.perf_counter()
+                asyncio.run(device.get_data(min_date = '2024-01-01', **kwargs))
+                elapsed.append(time.perf_counter() - start)
+                del device
+
+            device = SCDevice(1, check_postprocessing = False)
+            tracemalloc.start()
+            asyncio.run(device.get_data(min_date = '2024-01-01', **kwargs))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f'{name:16} {min(elapsed):7.3f} s  peak {peak / 2**20:7.1f} MB  data {device.memory_usage / 2**20:7.1f} MB')
@@ -0,0 +1,372 @@
+'''
+    Local stand-in for the Smart Citizen API, with synthetic data, to run the
+    benchmarks (or any script) without network access. It serves:
+
+        GET  /v0/devices/{id}
+        GET  /v0/devices/{id}/readings
+        POST /v0/devices/{id}/readings
+        GET  /v0/devices/, /v0/sensors/ (paginated, with Link headers)
+        GET  /v0/devices/world_map
+        GET  /v0/search
+        GET  /v0/resources/{name} (JSON resource, like a blueprint)
+
+    Responses are delayed by the configured latency, and requests over the
+    configured rate are answered with 429 (and Retry-After). Devices and
+    resources have an ETag and Last-Modified, and conditional requests are
+    answered with 304 while they do not change. Settings can be changed while it runs with
+    POST /_settings (see StandInAPI.configure).
+
+    Usage: python benchmarks/server.py --port 8765 --latency 0.05 --throttle 20
+    Then point the connector to it with API_URL=http://localhost:8765/v0/
+'''
+from aiohttp import web
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional
+from hashlib import sha256
+import urllib.request
+import multiprocessing
+import argparse
+import asyncio
+import time
+import json
+
+START = datetime(2024, 1, 1, tzinfo = timezone.utc)
+
+# A few locations in different timezones
+LOCATIONS = [
+    (41.39, 2.17, 'Barcelona', 'ES'),
+    (51.51, -0.13, 'London', 'GB'),
+    (40.71, -74.01, 'New York', 'US'),
+    (35.68, 139.69, 'Tokyo', 'JP'),
+    (-33.87, 151.21, 'Sydney', 'AU'),
+]
+
+# Seconds per rollup unit (calendar units approximated)
+ROLLUPS = {'y': 365*86400, 'M': 30*86400, 'w': 7*86400, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+# Counts of the server, see StandInAPI.get_counts
+COUNTS = {'requests': 0, 'throttled': 0, 'posted': 0, 'not_modified': 0, 'max_in_flight': 0}
+
+DEFAULTS = {
+    # Seconds before each response
+    'latency': 0.0,
+    # Items per page in the list endpoints
+    'per_page': 100,
+    # Devices in the list endpoints and in the world map
+    'devices': 1000,
+    # Sensors per device
+    'sensors': 5,
+    # Readings per sensor, one per minute from START
+    'rows': 1440,
+    # Number of sensors (the last ones) with one reading every 10 minutes only
+    'slow_sensors': 0,
+    # Maximum requests per second, the rest get a 429. None for no limit
+    'throttle': None,
+    # Retry-After of the 429 responses (seconds)
+    'retry_after': 1,
+    # Status of the GET readings responses, i.e. 500 to make them fail
+    'readings_status': 200,
+    # Version of the resources. Changing it changes their content and ETag
+    'resource_version': 1,
+    # Status of the POST readings responses, i.e. 500 to make them fail
+    'post_status': 200,
+    # Number of POST readings requests that get post_status (then 200). None for all
+    'post_failures': None,
+}
+
+def format_date(date):
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def parse_date(value):
+    # The connector sends i.e. 2024-01-01 00:00:00+00:00 (+ may arrive as a space)
+    if not value:
+        return None
+    return datetime.strptime(value[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S').replace(tzinfo = timezone.utc)
+
+def parse_rollup(value):
+    # Readings are generated once per minute at most
+    if not value or value.endswith('ms'):
+        return 60
+    number, unit = value[:-1], value[-1]
+    return max(60, (int(number) if number else 1) * ROLLUPS.get(unit, 60))
+
+class StandInAPI:
+    '''
+        Stand-in Smart Citizen API
+        Parameters
+        ----------
+            **settings
+                Overrides of DEFAULTS. They can also be changed while the
+                server runs, with configure
+    '''
+
+    def __init__(self, **settings):
+        self.settings = dict(DEFAULTS, **settings)
+        self.counts = dict(COUNTS)
+        self._requests = list()
+        self._in_flight = 0
+        self._process = None
+
+    def device(self, id, reduced = False):
+        latitude, longitude, city, country_code = LOCATIONS[id % len(LOCATIONS)]
+        last_reading_at = START + timedelta(minutes = self.settings['rows'] - 1)
+        device = {
+            "id": id,
+            "name": f"Device {id}",
+            "description": None,
+            "state": "has_published",
+            "hardware": {"name": "SCK 2.1", "type": "SCK", "version": "2.1", "slug": "sck:2,1"},
+            "system_tags": ["online", "outdoor"],
+            "user_tags": [],
+            "last_reading_at": format_date(last_reading_at),
+            "location": {"city": city, "country_code": country_code,
+                "latitude": latitude, "longitude": longitude},
+        }
+        if reduced:
+            return device
+        # Private fields are filtered, like in the API without authentication
+        device["hardware"] = dict(device["hardware"], last_status_message = "[FILTERED]")
+        device.update({
+            "uuid": f"uuid-{id}",
+            "postprocessing": None,
+            "data_policy": {"is_private": False, "precise_location": False, "enable_forwarding": "[FILTERED]"},
+            "notify": {"low_battery": False, "stopped_publishing": False},
+            "created_at": format_date(START - timedelta(days = 1)),
+            "updated_at": format_date(last_reading_at),
+            "owner": None,
+            "data": {"sensors": [self.sensor(100 + k) for k in range(self.settings['sensors'])]},
+        })
+        return device
+
+    def sensor(self, id):
+        return {"id": id, "uuid": f"sensor-{id}", "name": f"Sensor {id}",
+            "description": f"Sensor {id}", "unit": "ppm"}
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if request.path.startswith('/_'):
+            return await handler(request)
+        self.counts['requests'] += 1
+        throttle = self.settings['throttle']
+        if throttle:
+            # Sliding window of the last second
+            now = time.monotonic()
+            self._requests = [t for t in self._requests if now - t < 1]
+            if len(self._requests) >= throttle:
+                self.counts['throttled'] += 1
+                return web.json_response({"error": "Too Many Requests"}, status = 429,
+                    headers = {'Retry-After': str(self.settings['retry_after'])})
+            self._requests.append(now)
+        self._in_flight += 1
+        self.counts['max_in_flight'] = max(self.counts['max_in_flight'], self._in_flight)
+        try:
+            if self.settings['latency']:
+                await asyncio.sleep(self.settings['latency'])
+            return await handler(request)
+        finally:
+            self._in_flight -= 1
+
+    def paginate(self, request, total, item):
+        # Only the items of the requested page are made, with item(index)
+        per_page = int(request.query.get('per_page', self.settings['per_page']))
+        page = int(request.query.get('page', 1))
+        last = max(1, -(-total // per_page))
+        url = request.url.with_query(dict(request.query, per_page = per_page))
+        links = [f'<{url.update_query(page = 1)}>; rel="first"',
+            f'<{url.update_query(page = last)}>; rel="last"']
+        if page > 1: links.append(f'<{url.update_query(page = page - 1)}>; rel="prev"')
+        if page < last: links.append(f'<{url.update_query(page = page + 1)}>; rel="next"')
+        headers = {'Total': str(total), 'Per-Page': str(per_page), 'Link': ', '.join(links)}
+        items = [item(index) for index in range((page - 1) * per_page, min(page * per_page, total))]
+        return web.json_response(items, headers = headers)
+
+    def conditional_response(self, request, data, last_modified):
+        # 304 if the client has this version, by ETag or else by Last-Modified
+        body = json.dumps(data).encode()
+        headers = {'ETag': f'"{sha256(body).hexdigest()[:16]}"',
+            'Last-Modified': format_datetime(last_modified, usegmt = True)}
+        if 'If-None-Match' in request.headers:
+            not_modified = request.headers['If-None-Match'] == headers['ETag']
+        else:
+            not_modified = request.headers.get('If-Modified-Since') == headers['Last-Modified']
+        if not_modified:
+            self.counts['not_modified'] += 1
+            return web.Response(status = 304, headers = headers)
+        return web.Response(body = body, content_type = 'application/json', headers = headers)
+
+    async def get_resource(self, request):
+        version = self.settings['resource_version']
+        return self.conditional_response(request, {"name": request.match_info['name'],
+            "version": version, "channels": [f"Channel {n}" for n in range(version)]},
+            START + timedelta(days = version))
+
+    async def get_device(self, request):
+        # Devices change when new readings arrive (i.e. configuring more rows)
+        device = self.device(int(request.match_info['id']))
+        return self.conditional_response(request, device, parse_date(device['updated_at']))
+
+    async def get_devices(self, request):
+        return self.paginate(request, self.settings['devices'], lambda index: self.device(index + 1))
+
+    async def get_sensors(self, request):
+        return self.paginate(request, self.settings['sensors'], lambda index: self.sensor(100 + index))
+
+    async def get_world_map(self, request):
+        return web.json_response([self.device(id, reduced = True) for id in range(1, self.settings['devices'] + 1)])
+
+    async def search(self, request):
+        # Devices whose name or city contain the query
+        query = request.query.get('q', '').lower()
+        ids = [id for id in range(1, self.settings['devices'] + 1)
+            if query in f'device {id} {LOCATIONS[id % len(LOCATIONS)][2]}'.lower()]
+        return self.paginate(request, len(ids), lambda index: self.search_result(ids[index]))
+
+    def search_result(self, id):
+        _, _, city, country_code = LOCATIONS[id % len(LOCATIONS)]
+        return {"id": id, "type": "Device", "name": f"Device {id}", "description": None,
+            "owner_id": None, "owner_username": None, "city": city, "url": None,
+            "country_code": country_code, "country": None}
+
+    async def get_readings(self, request):
+        if self.settings['readings_status'] != 200:
+            return web.json_response({"error": "Readings failed"}, status = self.settings['readings_status'])
+        sensor_id = int(request.query['sensor_id'])
+        step = parse_rollup(request.query.get('rollup'))
+        if sensor_id - 100 >= self.settings['sensors'] - self.settings['slow_sensors']:
+            step = max(step, 600)
+        start = parse_date(request.query.get('from')) or START
+        end = parse_date(request.query.get('to')) or START + timedelta(minutes = self.settings['rows'])
+        end = min(end, START + timedelta(minutes = self.settings['rows'] - 1))
+        # One reading per rollup, from the first one after start
+        first = max(0, -(-int((start - START).total_seconds()) // step))
+        last = int((end - START).total_seconds()) // step
+        readings = [[format_date(START + timedelta(seconds = n * step)), float(sensor_id + n % 60)]
+            for n in range(first, last + 1)]
+        limit = request.query.get('limit')
+        if limit is not None:
+            readings = readings[:int(limit)]
+        # Latest first, like the API
+        readings.reverse()
+        return web.json_response({"device_id": int(request.match_info['id']), "sensor_key": None,
+            "sensor_id": sensor_id, "rollup": request.query.get('rollup'),
+            "function": request.query.get('function'), "readings": readings})
+
+    async def post_readings(self, request):
+        payload = json.loads(await request.read())
+        if self.settings['post_status'] != 200 and self.settings['post_failures'] != 0:
+            if self.settings['post_failures'] is not None:
+                self.settings['post_failures'] -= 1
+            return web.json_response({"error": "Post failed"}, status = self.settings['post_status'])
+        self.counts['posted'] += sum(len(item['sensors']) for item in payload['data'])
+        return web.json_response({}, status = 200)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares = [self.middleware])
+        app.add_routes([
+            web.get(r'/v0/devices/world_map', self.get_world_map),
+            web.get(r'/v0/devices/{id:\d+}', self.get_device),
+            web.get(r'/v0/devices/{id:\d+}/readings', self.get_readings),
+            web.post(r'/v0/devices/{id:\d+}/readings', self.post_readings),
+            web.get(r'/v0/devices/', self.get_devices),
+            web.get(r'/v0/sensors/', self.get_sensors),
+            web.get(r'/v0/search', self.search),
+            web.get(r'/v0/resources/{name}', self.get_resource),
+            web.get(r'/_settings', self.get_settings),
+            web.post(r'/_settings', self.post_settings),
+            web.post(r'/_reset', self.post_reset),
+        ])
+        return app
+
+    async def get_settings(self, request):
+        return web.json_response({'settings': self.settings, 'counts': self.counts})
+
+    async def post_settings(self, request):
+        self.settings.update(await request.json())
+        return web.json_response({'settings': self.settings, 'counts': self.counts})
+
+    async def post_reset(self, request):
+        self.counts = dict(COUNTS)
+        return web.json_response({'settings': self.settings, 'counts': self.counts})
+
+    def start(self, host: str = 'localhost', port: int = 0) -> str:
+        '''
+            Runs the server in a child process, so that it does not compete
+            with the code being measured (for the GIL or in tracemalloc)
+            Returns
+            -------
+                API url to use as API_URL, i.e. http://localhost:8765/v0/
+        '''
+        ports = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target = serve,
+            args = (self.settings, host, port, ports), daemon = True)
+        self._process.start()
+        self.url = f'http://{host}:{ports.get(timeout = 30)}/v0/'
+
+        return self.url
+
+    def __settings__(self, settings: Optional[dict] = None, path: str = '/_settings') -> dict:
+        request = urllib.request.Request(self.url.replace('/v0/', path),
+            data = json.dumps(settings).encode() if settings is not None else None,
+            headers = {'Content-type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def configure(self, **settings):
+        '''
+            Changes the settings of the running server
+        '''
+        self.settings.update(settings)
+        if self._process is not None:
+            self.__settings__(settings)
+
+    def get_counts(self) -> dict:
+        '''
+            Requests, throttled requests (429), posted readings, requests
+            answered with 304 and maximum number of requests in flight
+        '''
+        if self._process is None:
+            return self.counts
+        return self.__settings__()['counts']
+
+    def reset_counts(self):
+        self.counts = dict(COUNTS)
+        if self._process is not None:
+            self.__settings__({}, path = '/_reset')
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+def serve(settings: dict, host: str, port: int, ports: 'multiprocessing.Queue'):
+    # Entry point of the server process started with StandInAPI.start
+    async def main():
+        runner = web.AppRunner(StandInAPI(**settings).make_app(), access_log = None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        ports.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default = 'localhost')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--latency', type = float, default = DEFAULTS['latency'])
+    parser.add_argument('--per-page', type = int, default = DEFAULTS['per_page'])
+    parser.add_argument('--devices', type = int, default = DEFAULTS['devices'])
+    parser.add_argument('--sensors', type = int, default = DEFAULTS['sensors'])
+    parser.add_argument('--rows', type = int, default = DEFAULTS['rows'])
+    parser.add_argument('--slow-sensors', type = int, default = DEFAULTS['slow_sensors'])
+    parser.add_argument('--throttle', type = float, default = DEFAULTS['throttle'])
+    parser.add_argument('--retry-after', type = float, default = DEFAULTS['retry_after'])
+    args = parser.parse_args()
+
+    api = StandInAPI(latency = args.latency, per_page = args.per_page, devices = args.devices,
+        sensors = args.sensors, rows = args.rows, slow_sensors = args.slow_sensors, throttle = args.throttle, retry_after = args.retry_after)
+    print(f'Serving on http://{args.host}:{args.port}/v0/')
+    web.run_app(api.make_app(), host = args.host, port = args.port, print = None, access_log = None)
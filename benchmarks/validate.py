@@ -0,0 +1,68 @@
+'''
+    Benchmark of the decoding and validation of list pages (i.e. the device
+    catalogue): json parsing plus a new TypeAdapter per page (before) vs.
+    a shared adapter validating the raw bytes (after).
+
+    Usage: python benchmarks/validate.py --pages 100 --per-page 100 --repeat 3
+'''
+from smartcitizen_connector.models import Device, get_adapter
+from pydantic import TypeAdapter
+from typing import List
+import argparse
+import json
+import time
+
+def make_device(n):
+    return {"id": n, "uuid": f"uuid-{n}", "name": f"Device {n}", "description": None,
+        "state": "has_published", "postprocessing": None,
+        "hardware": {"name": "SCK 2.1", "type": "SCK", "version": "2.1", "slug": "sck:2,1"},
+        "system_tags": ["online", "outdoor"], "user_tags": ["Barcelona"],
+        "data_policy": {"is_private": False, "precise_location": False, "enable_forwarding": False},
+        "notify": {"low_battery": False, "stopped_publishing": False},
+        "last_reading_at": "2024-01-02T00:00:00Z", "created_at": "2023-01-01T00:00:00Z",
+        "updated_at": "2024-01-02T00:00:00Z", "owner": None,
+        "data": {"sensors": [{"id": 100 + k, "uuid": f"s{k}", "name": f"Sensor {k}",
+            "description": "description", "unit": "ppm", "value": 1.5} for k in range(10)]},
+        "location": {"city": "Barcelona", "country_code": "ES", "latitude": 41.39, "longitude": 2.17}}
+
+def before(pages):
+    result = list()
+    for page in pages:
+        result += TypeAdapter(List[Device]).validate_python(json.loads(page))
+    return result
+
+def after(pages):
+    result = list()
+    adapter = get_adapter(List[Device])
+    for page in pages:
+        result += adapter.validate_json(page)
+    return result
+
+def measure(function, pages, repeat):
+    # Best of repeat runs
+    elapsed = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(pages)
+        elapsed.append(time.perf_counter() - start)
+    return result, min(elapsed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type = int, default = 100)
+    parser.add_argument('--per-page', type = int, default = 100)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    pages = [json.dumps([make_device(page * args.per_page + n) for n in range(args.per_page)]).encode()
+        for page in range(args.pages)]
+
+    before_result, before_time = measure(before, pages, args.repeat)
+    after_result, after_time = measure(after, pages, args.repeat)
+
+    assert before_result == after_result
+
+    print(f'{args.pages} pages x {args.per_page} devices')
+    print(f'json + TypeAdapter:  {before_time:8.3f} s')
+    print(f'shared validate_json: {after_time:8.3f} s')
+    print(f'speedup: {before_time/after_time:.1f}x')
@@ -50,9 +50,12 @@ setup(
         "timezonefinder",
         "urllib3",
         "aiohttp",
-        "aiohttp-retry",
         "termcolor",
         "tqdm"],
+    extras_require={
+        "store": ["pyarrow"],
+        "arrow": ["pyarrow"]
+    },
     setup_requires=['wheel'],
     zip_safe=False
 )
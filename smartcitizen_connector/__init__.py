@@ -1,12 +1,60 @@
 # from .models import (Sensor, Measurement, Owner, User, Location,
 #                      HardwareInfo, Postprocessing, Data, Device, Experiment)
-from .handler import HttpHandler
-from .device import SCDevice, get_world_map #, get_devices
-from .sensor import SensorHandler, get_sensors
-from .measurement import MeasurementHandler, get_measurements
-from .experiment import ExperimentHandler, get_experiments
-from .search import search_by_query, global_search
-from .user import UserHandler, get_users
+from typing import TYPE_CHECKING
+from importlib import import_module
+
+# Public names and the subpackage they live in. Subpackages (and their
+# dependencies, i.e. pandas or aiohttp) are only imported on first access
+_lazy_imports = {
+    'SCClient': 'client',
+    'HttpArchive': 'client',
+    'HttpHandler': 'handler',
+    'paginate': 'handler',
+    'async_paginate': 'handler',
+    'SCDevice': 'device',
+    'get_world_map': 'device',
+    'get_fleet_data': 'device',
+    'create_devices': 'device',
+    'get_timezones': 'device',
+    # 'get_devices': 'device',
+    'SensorHandler': 'sensor',
+    'get_sensors': 'sensor',
+    'MeasurementHandler': 'measurement',
+    'get_measurements': 'measurement',
+    'ExperimentHandler': 'experiment',
+    'get_experiments': 'experiment',
+    'search_by_query': 'search',
+    'global_search': 'search',
+    'UserHandler': 'user',
+    'get_users': 'user',
+}
+
+_subpackages = ['cache', 'client', 'device', 'experiment', 'handler', 'measurement', 'metrics',
+    'models', 'search', 'sensor', 'store', 'tools', 'user']
+
+if TYPE_CHECKING:
+    from .client import SCClient, HttpArchive
+    from .handler import HttpHandler, paginate, async_paginate
+    from .device import SCDevice, get_world_map, get_fleet_data, create_devices, get_timezones #, get_devices
+    from .sensor import SensorHandler, get_sensors
+    from .measurement import MeasurementHandler, get_measurements
+    from .experiment import ExperimentHandler, get_experiments
+    from .search import search_by_query, global_search
+    from .user import UserHandler, get_users
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        value = getattr(import_module(f'.{_lazy_imports[name]}', __name__), name)
+    elif name in _subpackages:
+        value = import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    # Only resolved once
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports) | set(_subpackages))
 
 __all__ = [
     "Device",
@@ -49,4 +49,64 @@ class Config():
 
     _max_concurrent_requests = 5
 
+    # Rate limit shared by all the requests (requests per second). It goes down
+    # on 429 responses (x _rate_limit_backoff, pausing for Retry-After) and up on
+    # successful ones (+ _rate_limit_increase). None to disable it
+    _rate_limit = 20
+    _rate_limit_burst = 20
+    _rate_limit_min = 0.5
+    _rate_limit_max = 100
+    _rate_limit_backoff = 0.5
+    _rate_limit_increase = 0.1
+    # Readings requests can be split in time windows of at most this number of rows
+    # (estimated from the rollup), requested concurrently. None (default) to make
+    # a single request per sensor
+    _max_rows_per_request = None
+    # Maximum number of windows per sensor. Longer requests get wider windows
+    _max_windows_per_request = 16
+    # Maximum number of values (rows x sensors) in a single combined readings POST
+    _max_values_per_post = 10000
+    # With compact = 'sparse' in get_data, columns with less than this fraction of
+    # non-null values are stored as sparse (below 0.5 they take less memory than dense)
+    _sparse_max_density = 0.25
+
+    # Connection pooling for the shared client
+    # Number of hosts to keep pools for and connections per host (requests)
+    _pool_connections = 10
+    _pool_maxsize = 20
+    # Total connections, connections per host and seconds to keep idle connections alive (aiohttp)
+    _pool_limit = 100
+    _pool_limit_per_host = 20
+    _keepalive_timeout = 30
+
+    # Cache for blueprints and hardware postprocessing recipes
+    _cache = True
+    # Number of urls kept in memory and seconds before revalidating them
+    _cache_maxsize = 128
+    _cache_ttl = 3600
+    # Optional directory to persist the cache between runs
+    if 'SC_CACHE_PATH' in os.environ:
+        _cache_path = os.environ['SC_CACHE_PATH']
+    else:
+        _cache_path = None
+
+    # Optional archive file to record or replay all the requests (see HttpArchive)
+    # Mode can be 'record', 'replay' or 'auto' (replay what is recorded, record the rest)
+    if os.environ.get('SC_ARCHIVE_PATH'):
+        _archive_path = os.environ['SC_ARCHIVE_PATH']
+    else:
+        _archive_path = None
+    _archive_mode = os.environ.get('SC_ARCHIVE_MODE', 'auto')
+
+    # Seconds during which the device metadata is considered fresh in get_data.
+    # After that, it is revalidated with a conditional request. None to always revalidate
+    _metadata_max_age = 60
+
+    # Timezones are memoised on the coordinates rounded to this number of decimals
+    _timezone_precision = 4
+    _timezone_cache_maxsize = 16384
+
+    # Latencies kept per endpoint by the metrics aggregators, for the percentiles
+    _metrics_max_samples = 10000
+
 config = Config()
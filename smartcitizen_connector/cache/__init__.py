@@ -0,0 +1 @@
+from .cache import ResourceCache, cache
\ No newline at end of file
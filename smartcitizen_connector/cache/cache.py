@@ -0,0 +1,235 @@
+from smartcitizen_connector._config import config
+from smartcitizen_connector.tools import logger, safe_get, async_safe_fetch
+from smartcitizen_connector.models import get_adapter
+from collections import OrderedDict
+from typing import Optional, Any, Dict
+from copy import deepcopy
+from hashlib import sha256
+from json import loads, dumps
+from os import makedirs
+from os.path import join, exists
+import threading
+import asyncio
+import time
+
+class ResourceCache:
+    '''
+        Cache for remote JSON resources that are shared by many devices, such
+        as blueprints and hardware postprocessing recipes.
+        Resources are kept in an in-memory LRU and, optionally, on disk.
+        After ttl seconds they are revalidated with a conditional request
+        (ETag / Last-Modified). Validated models are cached along with the
+        raw JSON, and copies are returned so that callers can modify them.
+        Parameters
+        ----------
+            maxsize: int
+                config._cache_maxsize
+                Maximum number of urls kept in memory
+            ttl: float
+                config._cache_ttl
+                Seconds before a resource is revalidated
+            path: str
+                config._cache_path
+                Directory for the on-disk cache. None to keep it only in memory
+    '''
+
+    def __init__(self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None):
+
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._path = path
+        self._entries = OrderedDict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self) -> int:
+        return config._cache_maxsize if self._maxsize is None else self._maxsize
+
+    @property
+    def ttl(self) -> float:
+        return config._cache_ttl if self._ttl is None else self._ttl
+
+    @property
+    def path(self) -> Optional[str]:
+        return config._cache_path if self._path is None else self._path
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __filename__(self, url: str) -> str:
+        return join(self.path, sha256(url.encode()).hexdigest() + '.json')
+
+    def __get_entry__(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            if url in self._entries:
+                self._entries.move_to_end(url)
+                return self._entries[url]
+
+        if self.path is None or not exists(self.__filename__(url)):
+            return None
+
+        try:
+            with open(self.__filename__(url), 'r') as file:
+                stored = loads(file.read())
+        except:
+            logger.warning(f'Could not read cached {url}')
+            return None
+
+        entry = self.__make_entry__(url, stored['content'].encode(),
+            stored['etag'], stored['last_modified'], stored['fetched_at'], persist = False)
+        return entry
+
+    def __make_entry__(self, url: str, content: bytes, etag: Optional[str] = None,
+        last_modified: Optional[str] = None, fetched_at: Optional[float] = None, persist: bool = True) -> Dict:
+
+        entry = {
+            'json': loads(content),
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time() if fetched_at is None else fetched_at,
+            'models': dict()
+        }
+
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False)
+
+        if persist and self.path is not None:
+            self.__persist__(url, content, entry)
+
+        return entry
+
+    def __persist__(self, url: str, content: bytes, entry: Dict):
+        try:
+            makedirs(self.path, exist_ok = True)
+            with open(self.__filename__(url), 'w') as file:
+                file.write(dumps({
+                    'url': url,
+                    'etag': entry['etag'],
+                    'last_modified': entry['last_modified'],
+                    'fetched_at': entry['fetched_at'],
+                    'content': content.decode()
+                }))
+        except:
+            logger.warning(f'Could not persist {url} in cache')
+
+    def __conditional_headers__(self, entry: Optional[Dict]) -> Optional[Dict]:
+        if entry is None:
+            return None
+        headers = dict()
+        if entry['etag'] is not None: headers['If-None-Match'] = entry['etag']
+        if entry['last_modified'] is not None: headers['If-Modified-Since'] = entry['last_modified']
+        return headers or None
+
+    def __revalidated__(self, url: str, entry: Dict) -> Dict:
+        logger.info(f'Cached {url} not modified')
+        entry['fetched_at'] = time.time()
+        with self._lock:
+            self._entries[url] = entry
+        if self.path is not None:
+            self.__persist__(url, dumps(entry['json']).encode(), entry)
+        return entry
+
+    def __is_fresh__(self, entry: Optional[Dict]) -> bool:
+        return entry is not None and time.time() - entry['fetched_at'] < self.ttl
+
+    def __fetch__(self, url: str) -> Dict:
+        entry = self.__get_entry__(url)
+        if self.__is_fresh__(entry):
+            return entry
+
+        logger.info(f'Requesting {url}')
+        r = safe_get(url, headers = self.__conditional_headers__(entry))
+        if r.status_code == 304 and entry is not None:
+            return self.__revalidated__(url, entry)
+        r.raise_for_status()
+
+        return self.__make_entry__(url, r.content,
+            r.headers.get('ETag'), r.headers.get('Last-Modified'))
+
+    async def __async_fetch__(self, url: str, session) -> Dict:
+        entry = self.__get_entry__(url)
+        if self.__is_fresh__(entry):
+            return entry
+
+        # Only one request per url in flight. The rest wait for it
+        task = self._pending.get(url)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self.__async_request__(url, session, entry))
+            self._pending[url] = task
+            task.add_done_callback(lambda _: self._pending.pop(url, None))
+
+        return await asyncio.shield(task)
+
+    async def __async_request__(self, url: str, session, entry: Optional[Dict]) -> Dict:
+        logger.info(f'Requesting {url}')
+        status, headers, content = await async_safe_fetch(session, url,
+            headers = self.__conditional_headers__(entry))
+        if status == 304 and entry is not None:
+            return self.__revalidated__(url, entry)
+
+        return self.__make_entry__(url, content,
+            headers.get('ETag'), headers.get('Last-Modified'))
+
+    def get_json(self, url: str) -> Any:
+        '''
+            Returns a copy of the JSON in url, from cache if possible
+        '''
+        return deepcopy(self.__fetch__(url)['json'])
+
+    async def async_get_json(self, url: str, session) -> Any:
+        '''
+            Same as get_json, with aiohttp
+        '''
+        return deepcopy((await self.__async_fetch__(url, session))['json'])
+
+    def get_model(self, url: str, model: Any, field: Optional[str] = None, refresh: bool = True) -> Any:
+        '''
+            Returns a copy of the JSON in url (or its field) validated as model.
+            Validation is done only once per version of the resource
+            Parameters
+            ----------
+                url: str
+                    Resource url
+                model: type
+                    Type to validate against, i.e. HardwarePostprocessing or List[CalculatedChannel]
+                field: str
+                    None
+                    If not None, validate only this key of the JSON
+                refresh: bool
+                    True
+                    Revalidate the resource if older than ttl. If False, use
+                    the cached version if there is one
+            Returns
+            -------
+                Validated model
+        '''
+        entry = None if refresh else self.__get_entry__(url)
+        if entry is None:
+            entry = self.__fetch__(url)
+        return self.__validate__(entry, model, field)
+
+    async def async_get_model(self, url: str, model: Any, session, field: Optional[str] = None, refresh: bool = True) -> Any:
+        '''
+            Same as get_model, with aiohttp
+        '''
+        entry = None if refresh else self.__get_entry__(url)
+        if entry is None:
+            entry = await self.__async_fetch__(url, session)
+        return self.__validate__(entry, model, field)
+
+    def __validate__(self, entry: Dict, model: Any, field: Optional[str] = None) -> Any:
+        key = (model, field)
+        if key not in entry['models']:
+            data = entry['json'] if field is None else entry['json'][field]
+            entry['models'][key] = get_adapter(model).validate_python(data)
+        return deepcopy(entry['models'][key])
+
+cache = ResourceCache()
@@ -0,0 +1,3 @@
+from .client import SCClient, client
+from .limiter import RateLimiter
+from .archive import HttpArchive
\ No newline at end of file
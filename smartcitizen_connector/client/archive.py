@@ -0,0 +1,292 @@
+from smartcitizen_connector._config import config
+from smartcitizen_connector._config.log import logger
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from http import HTTPStatus
+from hashlib import sha256
+from base64 import b64encode, b64decode
+from typing import Optional, Callable, Dict, Any, TYPE_CHECKING
+from os.path import exists
+import threading
+import atexit
+import json
+import gzip
+
+if TYPE_CHECKING:
+    from requests import Response
+    from aiohttp import ClientSession, ClientResponse
+
+MODES = ['record', 'replay', 'auto']
+
+def is_archivable(status: int) -> bool:
+    '''
+        Only successful responses are archived. Errors (i.e. a transient 429
+        or 5xx) would otherwise be replayed on every retry, and 304 has no
+        content to replay
+    '''
+    return status < 400 and status != HTTPStatus.NOT_MODIFIED and status not in config._retry_codes
+
+def normalise_url(url: str, params: Any = None) -> str:
+    '''
+        Url with lowercase scheme and host, and the query parameters (plus
+        params, if any) sorted, so that the same request always has the same
+        key (i.e. sensor_id, from, to and rollup in any order)
+    '''
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values = True)
+    if params:
+        query += list(params.items()) if isinstance(params, dict) else list(params)
+    query = sorted((str(key), str(value)) for key, value in query)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+def make_key(method: str, url: str, params: Any = None, data: Any = None, json_data: Any = None) -> str:
+    '''
+        Archive key of a request: method and normalised url. Requests with a
+        body (i.e. POST) add its hash. Headers are not part of the key
+    '''
+    key = f'{method.upper()} {normalise_url(url, params)}'
+    if json_data is not None:
+        data = json.dumps(json_data, sort_keys = True)
+    if data:
+        if isinstance(data, str): data = data.encode()
+        key += ' ' + sha256(data).hexdigest()[:16]
+    return key
+
+class HttpArchive:
+    '''
+        Record/replay transport for the client. Requests (sync and async) are
+        recorded with their responses in a gzipped json lines file, and can
+        be replayed later without network access, i.e. to reprocess a batch
+        of devices with exactly the same data.
+        Responses are keyed by method and normalised url (see make_key).
+        Only successful responses are recorded (see is_archivable): errors
+        are requested again, and 304 (Not Modified) is replayed with the
+        full response.
+        Parameters
+        ----------
+            path: str
+                Archive file (i.e. readings.jsonl.gz). Records are appended
+                to it if it exists
+            mode: str
+                config._archive_mode
+                'record': all requests go to the API and are recorded
+                'replay': all requests are answered from the archive. Missing
+                ones raise KeyError
+                'auto': replay if recorded, otherwise request and record
+    '''
+
+    def __init__(self, path: str, mode: Optional[str] = None):
+        self.path = path
+        self.mode = mode or config._archive_mode
+        if self.mode not in MODES:
+            raise ValueError(f'Archive mode must be one of {MODES}, not {self.mode}')
+
+        self._records: Dict[str, Dict] = dict()
+        self._lock = threading.Lock()
+        self._file = None
+        self.hits = 0
+        self.misses = 0
+
+        if exists(self.path):
+            self.__load__()
+        atexit.register(self.close)
+
+    def __load__(self):
+        try:
+            with gzip.open(self.path, 'rt', encoding = 'utf-8') as file:
+                for line in file:
+                    record = json.loads(line)
+                    self._records[record['key']] = record
+        except (EOFError, OSError, ValueError):
+            # i.e. the last records of an interrupted run
+            logger.warning(f'Archive {self.path} is truncated, loaded {len(self._records)} records')
+        logger.info(f'Loaded {len(self._records)} records from {self.path}')
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._records
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        '''
+            Recorded response for key, if it should be replayed. None if it
+            should be requested. Raises KeyError if it is missing in replay mode
+        '''
+        if self.mode == 'record':
+            return None
+        record = self._records.get(key)
+        # Errors recorded by previous versions are not replayed
+        if record is not None and not is_archivable(record['status']):
+            record = None
+        if record is None:
+            self.misses += 1
+            if self.mode == 'replay':
+                raise KeyError(f'{key} not in archive {self.path}')
+        else:
+            self.hits += 1
+        return record
+
+    def record(self, key: str, method: str, url: str, status: int, headers: Any, body: bytes):
+        if not is_archivable(status):
+            return
+        try:
+            content, encoding = body.decode('utf-8'), None
+        except UnicodeDecodeError:
+            content, encoding = b64encode(body).decode(), 'base64'
+
+        record = {'key': key, 'method': method, 'url': url, 'status': status,
+            'headers': [[name, value] for name, value in headers.items()],
+            'body': content, 'encoding': encoding}
+        line = json.dumps(record) + '\n'
+
+        with self._lock:
+            self._records[key] = record
+            if self._file is None:
+                self._file = gzip.open(self.path, 'at', encoding = 'utf-8')
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def body(record: Dict) -> bytes:
+        if record['encoding'] == 'base64':
+            return b64decode(record['body'])
+        return record['body'].encode('utf-8')
+
+    def request(self, send: Callable, method: str, url: str, **kwargs) -> 'Response':
+        '''
+            Replays a requests call or makes it with send and records it
+        '''
+        key = make_key(method, url, kwargs.get('params'), kwargs.get('data'), kwargs.get('json'))
+        record = self.lookup(key)
+        if record is not None:
+            return self.__make_response__(record)
+
+        r = send(method, url, **kwargs)
+        self.record(key, method, url, r.status_code, r.headers, r.content)
+        return r
+
+    def __make_response__(self, record: Dict) -> 'Response':
+        from requests import Response
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+        r = Response()
+        r.status_code = record['status']
+        r.headers = CaseInsensitiveDict(record['headers'])
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.reason = HTTPStatus(r.status_code).phrase
+        r.url = record['url']
+        r._content = self.body(record)
+        return r
+
+    def wrap(self, session: 'ClientSession') -> 'ArchiveSession':
+        return ArchiveSession(session, self)
+
+class ReplayedResponse:
+    '''
+        Recorded response with the parts of aiohttp.ClientResponse used by
+        the connector
+    '''
+
+    def __init__(self, record: Dict):
+        from multidict import CIMultiDict, CIMultiDictProxy
+        from yarl import URL
+        self.method = record['method']
+        self.url = URL(record['url'])
+        self.status = record['status']
+        self.reason = HTTPStatus(self.status).phrase
+        self.headers = CIMultiDictProxy(CIMultiDict(record['headers']))
+        self._body = HttpArchive.body(record)
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None) -> str:
+        return self._body.decode(encoding or 'utf-8')
+
+    async def json(self, loads: Callable = json.loads, **kwargs) -> Any:
+        return loads(self._body)
+
+    def raise_for_status(self):
+        if not self.ok:
+            from aiohttp import ClientResponseError, RequestInfo
+            raise ClientResponseError(RequestInfo(self.url, self.method, self.headers, self.url),
+                (), status = self.status, message = self.reason, headers = self.headers)
+
+    def release(self):
+        pass
+
+class ArchiveRequest:
+    # Context manager returned by ArchiveSession.get, post...
+    def __init__(self, session: 'ArchiveSession', method: str, url: str, kwargs: Dict):
+        self._session = session
+        self._method = method
+        self._url = str(url)
+        self._kwargs = kwargs
+        self._response = None
+
+    async def __aenter__(self):
+        archive, kwargs = self._session.archive, dict(self._kwargs)
+        raise_for_status = kwargs.pop('raise_for_status', None)
+        key = make_key(self._method, self._url, kwargs.get('params'), kwargs.get('data'), kwargs.get('json'))
+        record = archive.lookup(key)
+        if record is not None:
+            response = ReplayedResponse(record)
+        else:
+            response = self._response = await self._session.session.request(self._method, self._url, **kwargs)
+            archive.record(key, self._method, self._url, response.status, response.headers, await response.read())
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+    async def __aexit__(self, *args):
+        if self._response is not None:
+            self._response.release()
+
+class ArchiveSession:
+    '''
+        aiohttp.ClientSession wrapper that replays (or records) the requests
+        with an HttpArchive. Only used as an async context manager, like:
+            async with session.get(url) as response:
+                content = await response.read()
+    '''
+
+    def __init__(self, session: 'ClientSession', archive: HttpArchive):
+        self.session = session
+        self.archive = archive
+
+    def request(self, method: str, url: str, **kwargs) -> ArchiveRequest:
+        return ArchiveRequest(self, method, url, kwargs)
+
+    def get(self, url: str, **kwargs) -> ArchiveRequest:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> ArchiveRequest:
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> ArchiveRequest:
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> ArchiveRequest:
+        return self.request('DELETE', url, **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self) -> 'ArchiveSession':
+        await self.session.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.__aexit__(*args)
+
+    def __getattr__(self, name: str):
+        return getattr(self.session, name)
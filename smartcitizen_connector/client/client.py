@@ -0,0 +1,201 @@
+from smartcitizen_connector._config import config
+from smartcitizen_connector._config.log import logger
+from smartcitizen_connector.client.limiter import RateLimiter
+from smartcitizen_connector.client.archive import HttpArchive, ArchiveSession
+from typing import Optional, Union, Dict, Tuple, TYPE_CHECKING
+import threading
+import asyncio
+
+if TYPE_CHECKING:
+    # requests and aiohttp are only imported when the first session is made
+    from requests import Session, Response
+    from aiohttp import ClientSession, TCPConnector, TraceConfig
+
+class SCClient:
+    '''
+        Long-lived HTTP client shared by all the connector calls.
+        It owns a pooled requests.Session for the sync calls and an aiohttp
+        connector per event loop that is reused by every aiohttp.ClientSession
+        created with async_session() in that loop, so that connections (and
+        TLS handshakes) are kept alive between requests. Each connector is
+        closed when its loop shuts down (i.e. at the end of asyncio.run).
+        Parameters
+        ----------
+            pool_connections: int
+                config._pool_connections
+                Number of hosts to keep a connection pool for (requests)
+            pool_maxsize: int
+                config._pool_maxsize
+                Maximum number of connections per host (requests)
+            limit: int
+                config._pool_limit
+                Maximum number of connections in total (aiohttp)
+            limit_per_host: int
+                config._pool_limit_per_host
+                Maximum number of connections per host (aiohttp)
+            keepalive_timeout: float
+                config._keepalive_timeout
+                Seconds to keep idle connections alive (aiohttp)
+            limiter: RateLimiter
+                None
+                Rate limiter for all the requests, sync and async. If None,
+                one is made with the config._rate_limit settings
+            archive: HttpArchive
+                None
+                Records or replays all the requests, sync and async. If None
+                and config._archive_path is set, one is made with it
+    '''
+
+    def __init__(self,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+        limiter: Optional[RateLimiter] = None,
+        archive: Optional[HttpArchive] = None):
+
+        self.pool_connections = pool_connections or config._pool_connections
+        self.pool_maxsize = pool_maxsize or config._pool_maxsize
+        self.limit = limit or config._pool_limit
+        self.limit_per_host = limit_per_host or config._pool_limit_per_host
+        self.keepalive_timeout = keepalive_timeout or config._keepalive_timeout
+        self.limiter = limiter or RateLimiter()
+        if archive is None and config._archive_path is not None:
+            archive = HttpArchive(config._archive_path)
+        self.archive = archive
+
+        self._session = None
+        self._trace_config = None
+        # {loop: (connector, task that closes it)}, loops can run in different threads
+        self._connectors: Dict['asyncio.AbstractEventLoop', Tuple['TCPConnector', 'asyncio.Task']] = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> 'Session':
+        if self._session is None:
+            logger.debug('Creating pooled requests session')
+            from requests import Session
+            from requests.adapters import HTTPAdapter
+            self._session = Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs) -> 'Response':
+        if self.archive is not None:
+            return self.archive.request(self.__send__, method, url, **kwargs)
+        return self.__send__(method, url, **kwargs)
+
+    def __send__(self, method: str, url: str, **kwargs) -> 'Response':
+        self.limiter.acquire()
+        r = self.session.request(method, url, **kwargs)
+        self.limiter.update(r.status_code, r.headers)
+        return r
+
+    def get(self, url: str, **kwargs) -> 'Response':
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> 'Response':
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> 'Response':
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> 'Response':
+        return self.request('DELETE', url, **kwargs)
+
+    @property
+    def connector(self) -> 'TCPConnector':
+        # aiohttp connectors are bound to the event loop they are created in,
+        # there is one for each loop that uses the client
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.__purge__()
+            connector, _ = self._connectors.get(loop, (None, None))
+            if connector is None or connector.closed:
+                logger.debug('Creating pooled aiohttp connector')
+                from aiohttp import TCPConnector
+                connector = TCPConnector(limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout)
+                self._connectors[loop] = (connector, loop.create_task(self.__close_with_loop__(connector)))
+        return connector
+
+    def __purge__(self):
+        # Forget the connectors of closed loops. They hold a reference to their
+        # loop, so they would be kept forever otherwise
+        for loop in [loop for loop in self._connectors if loop.is_closed()]:
+            connector, _ = self._connectors.pop(loop)
+            if not connector.closed:
+                # The loop was closed without cancelling its tasks
+                connector._close()
+
+    async def __close_with_loop__(self, connector: 'TCPConnector'):
+        # Waits until the task is cancelled, which asyncio.run does for all the
+        # pending tasks when it shuts down the loop, and closes the connector
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if not connector.closed:
+                await connector.close()
+
+    def async_session(self, **kwargs) -> Union['ClientSession', ArchiveSession]:
+        '''
+            aiohttp.ClientSession sharing the client connector. Closing the
+            session does not close the pooled connections. With an archive,
+            the session is wrapped to record or replay the requests
+        '''
+        from aiohttp import ClientSession
+        trace_configs = list(kwargs.pop('trace_configs', None) or []) + [self.trace_config]
+        session = ClientSession(connector=self.connector, connector_owner=False,
+            trace_configs=trace_configs, **kwargs)
+        if self.archive is not None:
+            return self.archive.wrap(session)
+        return session
+
+    @property
+    def trace_config(self) -> 'TraceConfig':
+        # Hooks the rate limiter in every request of the aiohttp sessions
+        if self._trace_config is None:
+            from aiohttp import TraceConfig, ClientResponseError
+
+            async def on_request_start(session, context, params):
+                await self.limiter.async_acquire()
+
+            async def on_request_end(session, context, params):
+                self.limiter.update(params.response.status, params.response.headers)
+
+            async def on_request_exception(session, context, params):
+                # Responses with raise_for_status end up here
+                if isinstance(params.exception, ClientResponseError):
+                    self.limiter.update(params.exception.status, params.exception.headers)
+
+            self._trace_config = TraceConfig()
+            self._trace_config.on_request_start.append(on_request_start)
+            self._trace_config.on_request_end.append(on_request_end)
+            self._trace_config.on_request_exception.append(on_request_exception)
+        return self._trace_config
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        '''
+            Closes the sync session and the connector of the running loop
+        '''
+        self.close()
+        with self._lock:
+            connector, task = self._connectors.pop(asyncio.get_running_loop(), (None, None))
+        if task is not None:
+            task.cancel()
+        if connector is not None and not connector.closed:
+            await connector.close()
+
+client = SCClient()
@@ -0,0 +1,162 @@
+from smartcitizen_connector._config import config
+from smartcitizen_connector._config.log import logger
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Optional
+import threading
+import asyncio
+import time
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    '''
+        Seconds to wait from a Retry-After header, either in seconds or as
+        an HTTP date. None if missing or invalid
+    '''
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0, (date - datetime.now(timezone.utc)).total_seconds())
+
+class RateLimiter:
+    '''
+        Token bucket shared by all the requests of the client, sync (threads)
+        and async (any event loop). Each request takes a token and waits for
+        it if there are none left.
+        The rate adapts to the API: it is multiplied by backoff on each 429
+        (and the bucket is paused for Retry-After, if the API sends it), and
+        increased by increase on each successful response, up to max_rate.
+        Parameters
+        ----------
+            rate: float
+                config._rate_limit
+                Initial requests per second. If 0 (or config._rate_limit is None),
+                requests are not limited
+            burst: int
+                config._rate_limit_burst
+                Maximum number of tokens in the bucket
+            min_rate: float
+                config._rate_limit_min
+            max_rate: float
+                config._rate_limit_max
+            backoff: float
+                config._rate_limit_backoff
+                Factor applied to the rate on each 429
+            increase: float
+                config._rate_limit_increase
+                Requests per second added to the rate on each successful response
+    '''
+
+    def __init__(self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        backoff: Optional[float] = None,
+        increase: Optional[float] = None):
+
+        self._rate = rate if rate is not None else config._rate_limit
+        if not self._rate: self._rate = None
+        self.burst = burst or config._rate_limit_burst
+        self.min_rate = min_rate or config._rate_limit_min
+        self.max_rate = max_rate or config._rate_limit_max
+        self.backoff = backoff or config._rate_limit_backoff
+        self.increase = increase if increase is not None else config._rate_limit_increase
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._cooldown_until = 0
+        self._waiting = 0
+        self.throttled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate is not None
+
+    @property
+    def rate(self) -> Optional[float]:
+        '''
+            Current requests per second
+        '''
+        return self._rate
+
+    @property
+    def queue_depth(self) -> int:
+        '''
+            Number of requests waiting for a token
+        '''
+        return self._waiting
+
+    def __reserve__(self) -> float:
+        # Takes a token (possibly in advance) and returns the seconds to wait for it
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+            return max(wait, self._paused_until - now)
+
+    def __waiting__(self, delta):
+        with self._lock:
+            self._waiting += delta
+
+    def acquire(self):
+        if not self.enabled: return
+        wait = self.__reserve__()
+        if wait > 0:
+            self.__waiting__(1)
+            try:
+                time.sleep(wait)
+            finally:
+                self.__waiting__(-1)
+
+    async def async_acquire(self):
+        if not self.enabled: return
+        wait = self.__reserve__()
+        if wait > 0:
+            self.__waiting__(1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.__waiting__(-1)
+
+    def update(self, status: int, headers = None):
+        '''
+            Adapts the rate to a response
+            Parameters
+            ----------
+                status: int
+                    Response status code
+                headers: dict
+                    None
+                    Response headers, for Retry-After
+        '''
+        if not self.enabled: return
+        with self._lock:
+            if status == HTTPStatus.TOO_MANY_REQUESTS:
+                self.throttled += 1
+                now = time.monotonic()
+                retry_after = parse_retry_after(headers.get('Retry-After') if headers is not None else None)
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+                # Requests sent at the old rate are throttled together, slow down once for all of them
+                if now >= self._cooldown_until:
+                    self._rate = max(self.min_rate, self._rate * self.backoff)
+                    # Spend the burst, next requests go at the new rate
+                    self._tokens = min(self._tokens, 0)
+                    self._cooldown_until = max(self._paused_until, now) + self.burst / self._rate
+                    logger.warning(f'API throttled the request. Rate limit down to {self._rate:.2f} requests/s')
+            elif status < 400:
+                self._rate = min(self.max_rate, self._rate + self.increase)
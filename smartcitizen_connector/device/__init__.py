@@ -1 +1 @@
-from .device import SCDevice, check_postprocessing, get_world_map #, get_devices
\ No newline at end of file
+from .device import SCDevice, check_postprocessing, get_world_map, get_fleet_data, create_devices, get_timezones #, get_devices
\ No newline at end of file
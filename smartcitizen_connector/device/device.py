@@ -1,20 +1,24 @@
-from smartcitizen_connector.models import (Device, ReducedDevice, HardwarePostprocessing, CalculatedChannel, Check, Postprocessing, HardwareStatus, Policy)
+from smartcitizen_connector.models import (Device, ReducedDevice, HardwarePostprocessing, CalculatedChannel, Check, Postprocessing, HardwareStatus, Policy, get_adapter)
 from smartcitizen_connector._config import config
-from smartcitizen_connector.tools import logger, safe_get, tf, \
-    convert_freq_to_rollup, clean, localise_date, url_checker, process_headers, get_alphasense, \
-    get_pt_temp, find_by_field, dict_fmerge, get_request_headers
-from typing import Optional, List, Dict
-from requests import get, post, patch
-from aiohttp_retry import RetryClient, ExponentialRetry
-from aiohttp import ClientResponseError, ClientResponse, ClientSession, ContentTypeError
-from pandas import DataFrame, to_datetime
+from smartcitizen_connector.tools import logger, safe_get, async_safe_get, async_safe_fetch, get_timezone, \
+    convert_freq_to_rollup, clean, localise_date, url_checker, get_alphasense, \
+    get_pt_temp, find_by_field, dict_fmerge, get_request_headers, split_time_windows, \
+    combine_frames, make_readings_payload, split_chunks, parse_readings, merge_readings, \
+    compact_frame, get_memory_usage
+from smartcitizen_connector.client import client
+from smartcitizen_connector.metrics import measure
+from smartcitizen_connector.handler import paginate
+from smartcitizen_connector.cache import cache
+from smartcitizen_connector.store import ReadingsStore, merge_coverage, missing_ranges
+from typing import Optional, List, Dict, Tuple
+from aiohttp import ClientResponseError
+from pandas import DataFrame, to_datetime, concat
 from datetime import datetime
 from os import environ
-from pydantic import TypeAdapter
+from pydantic import ValidationError
 import sys
 import json
-from math import isnan
-from tqdm import trange
+from tqdm import tqdm
 from json import dumps, JSONEncoder, loads
 import asyncio
 import time
@@ -37,19 +41,33 @@ def check_blueprint(blueprint_url):
         logger.info('No blueprint url')
         return None
     if url_checker(blueprint_url):
-        _blueprint = safe_get(blueprint_url).json()
+        if config._cache:
+            _blueprint = cache.get_json(blueprint_url)
+        else:
+            _blueprint = safe_get(blueprint_url).json()
     else:
         logger.info(f'No valid blueprint in url')
         _blueprint = None
     return _blueprint
 
-def check_postprocessing(postprocessing):
-    # Postprocessing should be dict or Postprocessing Model
-    if postprocessing is None:
-        return None, None, False
+async def async_check_blueprint(blueprint_url, session):
+    if blueprint_url is None or not blueprint_url:
+        logger.info('No blueprint url')
+        return None
+    if url_checker(blueprint_url):
+        if config._cache:
+            _blueprint = await cache.async_get_json(blueprint_url, session)
+        else:
+            _blueprint = loads(await async_safe_get(session, blueprint_url))
+    else:
+        logger.info(f'No valid blueprint in url')
+        _blueprint = None
+    return _blueprint
 
+def get_hardware_url(postprocessing):
+    # Postprocessing should be dict or Postprocessing Model
     if type(postprocessing) == dict:
-        _postprocessing = TypeAdapter(Postprocessing).validate_python(postprocessing)
+        _postprocessing = get_adapter(Postprocessing).validate_python(postprocessing)
     else:
         _postprocessing = postprocessing
 
@@ -64,35 +82,170 @@ def check_postprocessing(postprocessing):
 
     logger.info(f'Device {_postprocessing.device_id} has postprocessing information')
 
-    _ok = True
+    return tentative_url
+
+def check_postprocessing(postprocessing):
+    if postprocessing is None:
+        return None, None, False
+
+    tentative_url = get_hardware_url(postprocessing)
     # Make hardware postprocessing
-    if url_checker(tentative_url):
-        try:
-            r = safe_get(tentative_url)
-        except:
-            _ok = False
-            _hardware_postprocessing = None
-            pass
-    else:
-        _hardware_postprocessing = None
-        _ok = False
+    if not url_checker(tentative_url):
+        return '', None, False
+
+    try:
+        if config._cache:
+            _hardware_postprocessing = cache.get_model(tentative_url, HardwarePostprocessing)
+        else:
+            _hardware_postprocessing = get_adapter(HardwarePostprocessing).validate_json(safe_get(tentative_url).content)
+    except ValidationError:
+        return tentative_url, None, False
+    except:
+        return '', None, False
+
+    return tentative_url, _hardware_postprocessing, True
+
+async def async_check_postprocessing(postprocessing, session):
+    if postprocessing is None:
+        return None, None, False
+
+    tentative_url = get_hardware_url(postprocessing)
+    # Make hardware postprocessing
+    if not url_checker(tentative_url):
+        return '', None, False
 
-    if _ok:
-        _hardware_url = tentative_url
+    try:
+        if config._cache:
+            _hardware_postprocessing = await cache.async_get_model(tentative_url, HardwarePostprocessing, session)
+        else:
+            _hardware_postprocessing = get_adapter(HardwarePostprocessing).validate_json(await async_safe_get(session, tentative_url))
+    except ValidationError:
+        return tentative_url, None, False
+    except:
+        return '', None, False
+
+    return tentative_url, _hardware_postprocessing, True
+
+class LazyAttribute:
+    '''
+        Attribute of SCDevice resolved on first access in lazy mode (see
+        SCDevice.__resolve__). Not in __getattr__: errors while resolving
+        (even AttributeError) have to be raised as they are
+    '''
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, device, owner = None):
+        if device is None:
+            return self
+        attributes = device.__dict__
+        if attributes.get('_lazy_pending', False):
+            attributes['_lazy_pending'] = False
+            try:
+                device.__resolve__()
+            except:
+                attributes['_lazy_pending'] = True
+                raise
         try:
-            _hardware_postprocessing = TypeAdapter(HardwarePostprocessing).validate_python(r.json())
-        except:
-            _ok = False
-            _hardware_postprocessing = None
-            pass
-    else:
-        _hardware_url = ''
+            return attributes[self.name]
+        except KeyError:
+            raise AttributeError(f"'{type(device).__name__}' object has no attribute '{self.name}'") from None
 
-    return _hardware_url, _hardware_postprocessing, _ok
+    def __set__(self, device, value):
+        device.__dict__[self.name] = value
 
 class SCDevice:
 
-    def __init__(self, id = None, params = None, check_postprocessing=True):
+    # Resolved on first access in lazy mode
+    _hardware_postprocessing = LazyAttribute()
+    _blueprint = LazyAttribute()
+    _channels = LazyAttribute()
+    _checks = LazyAttribute()
+    _properties = LazyAttribute()
+    _filled_properties = LazyAttribute()
+
+    def __init__(self, id = None, params = None, check_postprocessing=True, lazy=False):
+        self.__setup__(id, params)
+        self.__load__()
+        self.__get_timezone__()
+        if check_postprocessing and lazy:
+            self._lazy_pending = True
+        else:
+            if check_postprocessing:
+                self.__check_postprocessing__()
+                self.__check_blueprint__()
+            self.__make_blueprint__(check_postprocessing)
+
+        logger.info(f'Device {self.json.id} initialized')
+
+    def __resolve__(self):
+        logger.info(f'Resolving postprocessing of {self.id}')
+        self.__check_postprocessing__()
+        self.__check_blueprint__()
+        self.__make_blueprint__(True)
+
+    @classmethod
+    async def create(cls, id = None, params = None, check_postprocessing=True, session = None, semaphore = None, lazy = False):
+        """
+        Asynchronous alternative to SCDevice(...). Loads the device, its
+        hardware postprocessing and blueprint with aiohttp, without blocking
+        the event loop
+        Parameters
+        ----------
+            id, params, check_postprocessing, lazy:
+                Same as in SCDevice. In lazy mode, the postprocessing is
+                resolved (synchronously) on first access
+            session: aiohttp.ClientSession
+                None
+                Session to use. If None, one is made from the shared client
+            semaphore: asyncio.Semaphore
+                None
+                Semaphore to limit the requests in flight, shared between
+                devices. If None, one is made with config._max_concurrent_requests
+        Returns
+        -------
+            SCDevice
+        """
+        device = cls.__new__(cls)
+        device.__setup__(id, params)
+
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(config._max_concurrent_requests)
+
+        if session is None:
+            async with client.async_session() as session:
+                await device.__async_init__(check_postprocessing, session, semaphore, lazy)
+        else:
+            await device.__async_init__(check_postprocessing, session, semaphore, lazy)
+
+        return device
+
+    async def __async_init__(self, check_postprocessing, session, semaphore, lazy = False):
+        async with semaphore:
+            _, headers, content = await async_safe_fetch(session, self.url, headers=self._headers)
+        self.__set_freshness__(headers)
+        self.__parse__(loads(content))
+        self.__get_timezone__()
+        if check_postprocessing and lazy:
+            self._lazy_pending = True
+            logger.info(f'Device {self.json.id} initialized')
+            return
+        if check_postprocessing:
+            logger.info(f'Checking postprocessing of {self.id}')
+            if self.json.postprocessing is not None:
+                async with semaphore:
+                    self.json.postprocessing.hardware_url, self._hardware_postprocessing, valid = \
+                        await async_check_postprocessing(self.json.postprocessing, session)
+            else:
+                self._hardware_postprocessing = None
+                logger.warning('No postprocessing information')
+            async with semaphore:
+                self._blueprint = await async_check_blueprint(self.blueprint_url, session)
+        self.__make_blueprint__(check_postprocessing)
+
+        logger.info(f'Device {self.json.id} initialized')
+
+    def __setup__(self, id, params):
         if id is not None:
             self.id = id
         elif params is not None:
@@ -105,15 +258,20 @@ class SCDevice:
         self.page = f'{config.FRONTEND_URL}{self.id}'
         self.method = 'async'
         self.data = DataFrame()
-        self._channels: List[CalculatedChannel] = []
+        self._channels: List[CalculatedChannel]
         self._headers = get_request_headers()
-        self.__load__()
-        self.__get_timezone__()
+        # Freshness of the device metadata
+        self._loaded_at = None
+        self._etag = None
+        self._last_modified = None
+
+    def __make_blueprint__(self, check_postprocessing):
         if check_postprocessing:
-            self.__check_postprocessing__()
             self._filled_properties = list()
             self._properties = dict()
-            if self.__check_blueprint__():
+            self._channels = []
+            self._checks = []
+            if self._blueprint is not None:
                 if self.__get_channels__():
                     # TODO Improve how this happens automatically
                     self._filled_properties.append('channels')
@@ -124,30 +282,96 @@ class SCDevice:
             self._channels = []
             self._checks = []
 
-        logger.info(f'Device {self.json.id} initialized')
+    def __request_headers__(self, conditional = False) -> Dict:
+        headers = dict(self._headers or {})
+        if conditional:
+            if self._etag is not None: headers['If-None-Match'] = self._etag
+            if self._last_modified is not None: headers['If-Modified-Since'] = self._last_modified
+        return headers
+
+    def __load__(self, conditional = False):
+        r = safe_get(self.url, headers=self.__request_headers__(conditional))
+        if r.status_code == 304:
+            logger.info(f'Device {self.id} metadata not modified')
+            self._loaded_at = time.monotonic()
+            return False
+
+        self.__set_freshness__(r.headers)
+        self.__parse__(r.json())
+        return True
+
+    def __set_freshness__(self, headers):
+        self._loaded_at = time.monotonic()
+        self._etag = headers.get('ETag')
+        self._last_modified = headers.get('Last-Modified')
+
+    def __is_stale__(self, max_date = None) -> bool:
+        # The metadata could have changed if the request goes beyond
+        # last_reading_at and it is older than config._metadata_max_age
+        if max_date is not None and self.json.last_reading_at is not None:
+            if localise_date(to_datetime(max_date), 'UTC') <= self.json.last_reading_at:
+                logger.info(f'Device {self.id} metadata is up to date for max_date')
+                return False
+
+        if config._metadata_max_age is not None and self._loaded_at is not None:
+            if time.monotonic() - self._loaded_at < config._metadata_max_age:
+                logger.info(f'Device {self.id} metadata is fresh')
+                return False
+
+        return True
+
+    def __refresh__(self, max_date = None):
+        '''
+            Reloads the device metadata only if it could have changed (see
+            __is_stale__). The reload is a conditional request (ETag /
+            Last-Modified), so that it is not parsed again if the device has
+            not changed. Returns True if the metadata was reloaded
+        '''
+        if not self.__is_stale__(max_date):
+            return False
+
+        return self.__load__(conditional = True)
+
+    async def __async_refresh__(self, session, semaphore, max_date = None):
+        '''
+            Same as __refresh__, with aiohttp, without blocking the event loop
+        '''
+        if not self.__is_stale__(max_date):
+            return False
+
+        async with semaphore:
+            status, headers, content = await async_safe_fetch(session, self.url,
+                headers = self.__request_headers__(conditional = True))
+        if status == 304:
+            logger.info(f'Device {self.id} metadata not modified')
+            self._loaded_at = time.monotonic()
+            return False
+
+        self.__set_freshness__(headers)
+        self.__parse__(loads(content))
+        return True
 
-    def __load__(self):
-        r = safe_get(self.url, headers=self._headers)
+    def __parse__(self, payload: Dict):
         # TODO assess if one day SCDevice can inherit directly from Device
-        self.json = TypeAdapter(Device).validate_python(r.json())
-        if r.json()['hardware']['last_status_message'] != '[FILTERED]':
+        self.json = get_adapter(Device).validate_python(payload)
+        if payload['hardware']['last_status_message'] != '[FILTERED]':
             logger.info('Device has status message')
-            if r.json()['hardware']['last_status_message'] is not None:
-                self._last_status_message = TypeAdapter(HardwareStatus).validate_python(r.json()['hardware']['last_status_message'])
+            if payload['hardware']['last_status_message'] is not None:
+                self._last_status_message = get_adapter(HardwareStatus).validate_python(payload['hardware']['last_status_message'])
             else:
                 self._last_status_message = None
         else:
             self._last_status_message = None
 
-        if r.json()['data_policy']['enable_forwarding'] != '[FILTERED]':
-            self._data_policy = TypeAdapter(Policy).validate_python(r.json()['data_policy'])
+        if payload['data_policy']['enable_forwarding'] != '[FILTERED]':
+            self._data_policy = get_adapter(Policy).validate_python(payload['data_policy'])
         else:
             self._data_policy = None
 
     def __get_timezone__(self) -> str:
 
         if self.json.location.latitude is not None and self.json.location.longitude is not None:
-            self.timezone = tf.timezone_at(lng=self.json.location.longitude, lat=self.json.location.latitude)
+            self.timezone = get_timezone(self.json.location.latitude, self.json.location.longitude)
 
         logger.info('Device {} timezone is {}'.format(self.id, self.timezone))
 
@@ -167,7 +391,11 @@ class SCDevice:
             logger.warning('No postprocessing information')
 
     def __get_channels__(self):
-        self._channels = TypeAdapter(List[CalculatedChannel]).validate_python([y for y in self._blueprint['channels']])
+        if config._cache and self.blueprint_url is not None:
+            # Blueprint is already in the cache, validate only once
+            self._channels = cache.get_model(self.blueprint_url, List[CalculatedChannel], 'channels', refresh = False)
+        else:
+            self._channels = get_adapter(List[CalculatedChannel]).validate_python([y for y in self._blueprint['channels']])
 
         # Convert that to channels now
         if self._hardware_postprocessing is not None:
@@ -193,7 +421,10 @@ class SCDevice:
             return True
 
     def __get_checks__(self):
-        self._checks = TypeAdapter(List[Check]).validate_python([y for y in self._blueprint['checks']])
+        if config._cache and self.blueprint_url is not None:
+            self._checks = cache.get_model(self.blueprint_url, List[Check], 'checks', refresh = False)
+        else:
+            self._checks = get_adapter(List[Check]).validate_python([y for y in self._blueprint['checks']])
 
     def __make_properties__(self):
         for item, value in self._blueprint.items():
@@ -203,33 +434,45 @@ class SCDevice:
                 self._properties[item] = value
 
     async def get_datum(self, semaphore, session, url, headers, sensor_id, resample, frequency, rename)->Dict:
-        async with semaphore:
-
-            async def evaluate_response(response: ClientResponse) -> bool:
-                try:
-                    await response.json()
-                except:
-                    return False
-                return True
-
-            retry_options = ExponentialRetry(attempts=config._max_retries,
-                statuses= [code.numerator for code in config._retry_codes],
-                evaluate_response_callback=evaluate_response,
-                start_timeout=config._retry_interval,
-                exceptions={ClientResponseError})
-
-            retry_client = RetryClient(client_session=session, retry_options=retry_options)
+        df_sensor = await self.__get_readings__(semaphore, session, url, headers, sensor_id)
+        if df_sensor is None:
+            return None
 
-            async with retry_client.get(url, headers = headers) as response:
+        return self.__format_readings__(df_sensor, sensor_id, resample, frequency, rename)
 
-                rdatum = await response.read()
-                datum = json.loads(rdatum)
+    async def __fetch_readings__(self, semaphore, session, url, headers, sensor_id, raise_errors = False) -> Optional[List]:
+        '''
+            Requests the readings in url. Returns them as sent by the API
+            ([timestamp, value], latest first), or None if there are none.
+            If the request fails, returns None too, or raises if raise_errors
+            (ClientResponseError, or ValueError for malformed responses)
+        '''
+        async with semaphore:
+            with measure('GET', url) as event:
+
+                for n in range(config._max_retries):
+                    try:
+                        status, _, rdatum = await async_safe_fetch(session, url, headers = headers)
+                    except ClientResponseError as exc:
+                        logger.warning(f"Device: {self.json.id} - Request for sensor {sensor_id} failed. API responded {exc.status}")
+                        if raise_errors: raise
+                        return None
+                    try:
+                        with event.timing('parse_time'):
+                            datum = json.loads(rdatum)
+                        break
+                    except ValueError:
+                        # Retry responses that are not valid json
+                        if n == config._max_retries - 1: raise
+                        event.retries += 1
+                        await asyncio.sleep(config._retry_interval)
 
                 sensor_name = find_by_field(self.json.data.sensors, sensor_id, 'id').name
 
                 if 'readings' not in datum:
                     logger.warning(f"Device: {self.json.id}- No readings in request for sensor: {sensor_id}: {sensor_name}")
-                    logger.warning(f"Response code: {response}")
+                    logger.warning(f"Response code: {status}")
+                    if raise_errors: raise ValueError(f'No readings in response for sensor {sensor_id}')
                     return None
 
                 if datum['readings'] == []:
@@ -238,42 +481,222 @@ class SCDevice:
 
                 logger.info(f"Device: {self.json.id} - Got readings for sensor: {sensor_id}: {sensor_name}")
 
-                # Make a Dataframe
-                # Set index
-                df_sensor = DataFrame(datum['readings']).set_index(0)
-                # Set columns
-                if rename:
-                    df_sensor.columns = [sensor_name]
-                else:
-                    df_sensor.columns = [str(sensor_id)]
-                # Localise index
-                df_sensor.index = localise_date(df_sensor.index, self.timezone)
-                # Sort it just in case
-                df_sensor.sort_index(inplace=True)
-                # Remove duplicates
-                df_sensor = df_sensor[~df_sensor.index.duplicated(keep='first')]
-                # Drop unnecessary columns
-                df_sensor.drop([i for i in df_sensor.columns if 'Unnamed' in i], axis=1, inplace=True)
-                # Check for weird things in the data
-                df_sensor = df_sensor.astype(float, errors='ignore')
-                # Resample
-                if (resample):
-                    df_sensor = df_sensor.resample(frequency).mean()
-
-                return df_sensor
+                return datum['readings']
 
-    async def get_data(self,
+    async def __get_readings__(self, semaphore, session, url, headers, sensor_id, raise_errors = False) -> Optional[DataFrame]:
+        '''
+            Requests the readings in url. Returns a DataFrame with a single
+            'value' column, indexed in UTC, sorted and without duplicates
+            (see __fetch_readings__ for raise_errors)
+        '''
+        with measure('GET', url) as event:
+            readings = await self.__fetch_readings__(semaphore, session, url, headers, sensor_id, raise_errors)
+            if readings is None:
+                return None
+
+            with event.timing('build_time'):
+                # Sorted, without duplicates and in UTC (see parse_readings)
+                timestamps, values = parse_readings(readings)
+                df_sensor = DataFrame({'value': values},
+                    index = to_datetime(timestamps, unit = 'ns', utc = True))
+
+            return df_sensor
+
+    async def __get_arrays__(self, semaphore, session, request) -> Optional[Tuple]:
+        '''
+            Same as __request_readings__, decoding the readings straight into
+            arrays (see parse_readings) instead of DataFrames
+        '''
+        async def get_window(window):
+            url = self.__readings_url__(**window)
+            with measure('GET', url) as event:
+                readings = await self.__fetch_readings__(semaphore, session, url,
+                    self._headers, request['sensor_id'])
+                if readings is None:
+                    return None
+                with event.timing('build_time'):
+                    return parse_readings(readings)
+
+        arrays = [item for item in await asyncio.gather(*[get_window(window)
+            for window in self.__split_request__(request)]) if item is not None]
+        if not arrays:
+            return None
+
+        # Windows share their boundaries
+        return merge_readings(arrays)
+
+    def __column_name__(self, sensor_id, rename) -> str:
+        if rename:
+            return find_by_field(self.json.data.sensors, sensor_id, 'id').name
+        return str(sensor_id)
+
+    def __format_readings__(self, df_sensor, sensor_id, resample, frequency, rename, keep_utc = False) -> DataFrame:
+        # Set columns
+        df_sensor.columns = [self.__column_name__(sensor_id, rename)]
+        # Localise index
+        if not keep_utc:
+            df_sensor.index = df_sensor.index.tz_convert(self.timezone)
+        # Resample
+        if (resample):
+            df_sensor = df_sensor.resample(frequency).mean()
+
+        return df_sensor
+
+    async def __get_stored_readings__(self, semaphore, session, request, store) -> Optional[DataFrame]:
+        '''
+            Same as __get_readings__, but only requests the readings that are
+            not in the store yet, and updates it
+        '''
+        loop = asyncio.get_running_loop()
+        sensor_id, rollup = request['sensor_id'], request['rollup']
+        min_date, max_date = request['min_date'], request['max_date']
+
+        df_stored, coverage = await loop.run_in_executor(None, store.load, self.id, sensor_id, rollup)
+        if coverage is None: coverage = []
+
+        # Only request what is not in the store (i.e. gaps between stored ranges)
+        missing = missing_ranges(coverage, min_date, max_date)
+        if not missing:
+            logger.info(f'Device {self.id} - Sensor {sensor_id} readings found in store')
+            return self.__slice_readings__(df_stored, min_date, max_date)
+        if df_stored is not None:
+            logger.info(f"Device {self.id} - Sensor {sensor_id} requesting {len(missing)} missing ranges")
+
+        async def request_missing(start, end):
+            # Returns whether the request succeeded (with or without readings)
+            try:
+                return True, await self.__request_readings__(semaphore, session,
+                    dict(request, min_date = start, max_date = end), raise_errors = True)
+            except (ClientResponseError, ValueError):
+                logger.warning(f'Device {self.id} - Sensor {sensor_id} readings from {start} to {end} failed, not stored')
+                return False, None
+
+        results = await asyncio.gather(*[request_missing(start, end) for start, end in missing])
+        dfs_missing = [df_missing for _, df_missing in results]
+
+        # Merge with stored readings, new readings win
+        dfs = [df for df in [df_stored] + dfs_missing if df is not None]
+        if not dfs:
+            return None
+        df = concat(dfs).sort_index()
+        df = df[~df.index.duplicated(keep='last')]
+
+        # Failed ranges are not covered, so that they are requested again
+        for (start, end), (ok, df_missing) in zip(missing, results):
+            if not ok: continue
+            # Open ranges are covered up to the last reading
+            if end is None:
+                end = df_missing.index[-1] if df_missing is not None and not df_missing.empty else start
+            coverage.append({'from': start, 'to': max(start, end)})
+        await loop.run_in_executor(None, store.save, self.id, sensor_id, rollup, df, merge_coverage(coverage))
+
+        return self.__slice_readings__(df, min_date, max_date)
+
+    def __slice_readings__(self, df_sensor, min_date, max_date) -> Optional[DataFrame]:
+        df_sensor = df_sensor.loc[min_date:max_date]
+        if df_sensor.empty:
+            return None
+        return df_sensor.copy()
+
+    def __split_request__(self, request) -> List[Dict]:
+        '''
+            Splits a request in time windows of at most
+            config._max_rows_per_request readings (and at most
+            config._max_windows_per_request windows). Consecutive windows
+            share their boundaries
+        '''
+        windows = [(request['min_date'], request['max_date'])]
+        if request['limit'] is None and config._max_rows_per_request is not None:
+            # No need to split before the device existed or after its last reading
+            min_date, max_date = request['min_date'], request['max_date']
+            if min_date is not None and self.json.created_at is not None:
+                min_date = max(min_date, self.json.created_at)
+            if max_date is None:
+                max_date = self.json.last_reading_at
+            if min_date is not None and max_date is not None:
+                windows = split_time_windows(min_date, max_date, request['rollup'],
+                    config._max_rows_per_request, config._max_windows_per_request)
+
+        if len(windows) == 1:
+            return [request]
+
+        requests = []
+        for n, (start, end) in enumerate(windows):
+            # Keep the original bounds at the edges of the request
+            window = dict(request)
+            window['min_date'] = request['min_date'] if n == 0 else start
+            window['max_date'] = request['max_date'] if n == len(windows) - 1 else end
+            requests.append(window)
+
+        return requests
+
+    async def __request_readings__(self, semaphore, session, request, raise_errors = False) -> Optional[DataFrame]:
+        '''
+            Same as __get_readings__ for a request. Long requests are split in
+            time windows of at most config._max_rows_per_request readings,
+            that are requested concurrently and stitched back together
+        '''
+        windows = self.__split_request__(request)
+
+        if len(windows) == 1:
+            return await self.__get_readings__(semaphore, session, self.__readings_url__(**request),
+                self._headers, request['sensor_id'], raise_errors)
+
+        logger.info(f"Device {self.id} - Splitting sensor {request['sensor_id']} in {len(windows)} requests")
+        tasks = []
+        for window in windows:
+            tasks.append(asyncio.ensure_future(self.__get_readings__(semaphore, session,
+                self.__readings_url__(**window), self._headers, request['sensor_id'], raise_errors)))
+
+        # Let every window finish before raising, if any failed
+        dfs_window = await asyncio.gather(*tasks, return_exceptions = True)
+        for df in dfs_window:
+            if isinstance(df, BaseException): raise df
+        dfs_window = [df for df in dfs_window if df is not None]
+        if not dfs_window:
+            return None
+
+        # Windows share their boundaries
+        df_sensor = concat(dfs_window).sort_index()
+        return df_sensor[~df_sensor.index.duplicated(keep='first')]
+
+    async def __get_sensor__(self, semaphore, session, request, resample, frequency, rename, store = None, keep_utc = False) -> Optional[DataFrame]:
+        if store is None or request['limit'] is not None:
+            df_sensor = await self.__request_readings__(semaphore, session, request)
+        else:
+            df_sensor = await self.__get_stored_readings__(semaphore, session, request, store)
+
+        if df_sensor is None:
+            return None
+
+        return self.__format_readings__(df_sensor, request['sensor_id'], resample, frequency, rename, keep_utc)
+
+    def __readings_url__(self, sensor_id, rollup, min_date = None, max_date = None, limit = None) -> str:
+        # Request sensor per ID
+        url = self.url + '/readings?'
+
+        if min_date is not None: url += f'from={min_date}'
+        if max_date is not None: url += f'&to={max_date}'
+        if limit is not None: url += f'&limit={limit}'
+
+        url += f'&rollup={rollup}'
+        url += f'&sensor_id={sensor_id}'
+        url += '&function=avg'
+
+        return url
+
+    def __plan_requests__(self,
         min_date: Optional[datetime] = None,
         max_date: Optional[datetime] = None,
         limit: Optional[int] = None,
         frequency: Optional[str] = '1Min',
-        clean_na: Optional[str] = None,
-        resample: Optional[bool] = False,
-        channels: Optional[List[str]] = [],
-        rename: Optional[bool] = True)->DataFrame:
-
-        logger.info(f'Make sure we are up to date')
-        self.__load__()
+        channels: Optional[List[str]] = []) -> Optional[List]:
+        '''
+            Checks the request against the device metadata and builds the
+            /readings requests for each sensor. Returns None if the request
+            would yield empty data, otherwise a list of requests (dict with
+            sensor_id, rollup, min_date, max_date and limit)
+        '''
 
         if self.json.state == 'never_published':
             logger.warning('Device has never published anything, skipping')
@@ -325,50 +748,261 @@ class SCDevice:
             return None
         else: logger.info(f"Sensor IDs: {[f'{sensor.name}: {sensor.id}' for sensor in self.json.data.sensors]}")
 
-        df = DataFrame()
         logger.info(f'Requesting device {self.id} from {min_date} to {max_date}')
 
-        semaphore = asyncio.Semaphore(config._max_concurrent_requests)
-        async with ClientSession() as session:
-
-            tasks = []
-            for sensor in self.json.data.sensors:
-                if channels:
-                    if sensor.name not in channels: continue
-
-                # Request sensor per ID
-                url = self.url + '/readings?'
-
-                if min_date is not None: url += f'from={min_date}'
-                if max_date is not None: url += f'&to={max_date}'
-                if limit is not None: url += f'&limit={limit}'
+        plan = []
+        for sensor in self.json.data.sensors:
+            if channels:
+                if sensor.name not in channels: continue
 
-                url += f'&rollup={rollup}'
-                url += f'&sensor_id={sensor.id}'
-                url += '&function=avg'
+            plan.append({
+                'sensor_id': sensor.id,
+                'rollup': rollup,
+                'min_date': min_date,
+                'max_date': max_date,
+                'limit': limit
+            })
 
-                tasks.append(asyncio.ensure_future(self.get_datum(semaphore, session, url, self._headers, sensor.id, resample, frequency, rename)))
-
-            dfs_sensor = await asyncio.gather(*tasks)
+        return plan
 
-        # Process received data
-        for df_sensor in dfs_sensor:
-            if df_sensor is None: continue
-            # Combine in the main df
-            df = df.combine_first(df_sensor)
+    def __make_data__(self, dfs_sensor: List[DataFrame], clean_na: Optional[str] = None, compact: Optional[str] = None) -> DataFrame:
+        if compact is not None:
+            # Cast each sensor before combining them, the combined df is never float64
+            dfs_sensor = [compact_frame(df) for df in dfs_sensor]
+        # Combine all sensors in the main df at once
+        df = combine_frames(dfs_sensor)
 
         try:
             df = df.reindex(df.index.rename('TIME'))
             df = clean(df, clean_na, how = 'all')
+            if compact == 'sparse':
+                df = compact_frame(df, sparse = True)
             self.data = df
         except:
             logger.error(f'Problem closing up the API dataframe for {self.id}')
             pass
 
-        logger.info(f'Device {self.id} loaded successfully from API')
+        return self.data
+
+    def __make_output__(self, arrays: List[Optional[Tuple]], plan: List[Dict], rename: bool, output: str, keep_utc: bool = False, compact: Optional[str] = None):
+        # Readings arrays of each sensor in plan, as dict or arrow table
+        data = {self.__column_name__(request['sensor_id'], rename): item
+            for request, item in zip(plan, arrays) if item is not None}
+        if compact is not None:
+            # Arrays only hold the readings, there is nothing to make sparse
+            data = {name: (timestamps, values.astype(np.float32) if values.dtype == float else values)
+                for name, (timestamps, values) in data.items()}
+
+        if output == 'arrow':
+            try:
+                import pyarrow as pa
+            except ImportError:
+                raise ImportError("output='arrow' needs pyarrow. Install it with: pip install smartcitizen-connector[arrow]")
+            lengths = [len(timestamps) for timestamps, _ in data.values()]
+            sensors = pa.DictionaryArray.from_arrays(
+                np.repeat(np.arange(len(data), dtype = np.int32), lengths), pa.array(list(data), type = pa.string()))
+            timestamps = np.concatenate([timestamps for timestamps, _ in data.values()]) if data else np.array([], dtype = np.int64)
+            values = np.concatenate([values for _, values in data.values()]) if data else np.array([], dtype = float)
+            data = pa.table({
+                'sensor': sensors,
+                'timestamp': pa.array(timestamps, type = pa.timestamp('ns', tz = 'UTC' if keep_utc else self.timezone or 'UTC')),
+                'value': pa.array(values)
+            })
+
+        self.data = data
+        return self.data
+
+    async def get_data(self,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        frequency: Optional[str] = '1Min',
+        clean_na: Optional[str] = None,
+        resample: Optional[bool] = False,
+        channels: Optional[List[str]] = [],
+        rename: Optional[bool] = True,
+        store: Optional[ReadingsStore] = None,
+        output: Optional[str] = 'pandas',
+        keep_utc: Optional[bool] = False,
+        compact: Optional[str] = None)->DataFrame:
+        '''
+            Gets the device data from the SmartCitizen API into self.data
+            Parameters
+            ----------
+                min_date: datetime
+                    None
+                    Minimum date. If None, from the beginning
+                max_date: datetime
+                    None
+                    Maximum date. If None, until the last reading
+                limit: int
+                    None
+                    Maximum number of readings per sensor
+                frequency: str
+                    '1Min'
+                    pandas frequency, converted to the API rollup
+                clean_na: string, optional
+                    None
+                    'drop', 'fill'
+                resample: bool
+                    False
+                    Resample each sensor to frequency
+                channels: list
+                    []
+                    Sensor names to request. If empty, all
+                rename: bool
+                    True
+                    Use sensor names as columns, otherwise sensor ids
+                store: ReadingsStore or str
+                    None
+                    Local store (or its path) to read readings from. Only the
+                    missing time range is requested and the store is updated
+                output: str
+                    'pandas'
+                    Format of self.data:
+                    'pandas': DataFrame with a column per sensor, in the device timezone
+                    'numpy': dict of {sensor: (timestamps, values)} arrays, with
+                    timestamps in int64 nanoseconds since epoch (UTC)
+                    'arrow': pyarrow.Table with sensor, timestamp and value columns
+                    (one row per reading)
+                    The readings are decoded straight into arrays, without
+                    DataFrames. resample, clean_na and store are only
+                    available with 'pandas'
+                keep_utc: bool
+                    False
+                    Keep the timestamps in UTC instead of converting them to the
+                    device timezone. Resampling is then done in UTC too
+                compact: str
+                    None
+                    Reduce the memory of self.data (see memory_usage):
+                    'float32': values in float32 instead of float64
+                    'sparse': float32, and sensors with less than
+                    config._sparse_max_density non-null values in sparse columns
+                    (i.e. sensors with a lower reading frequency than the others)
+            Returns
+            -------
+                True if the data was loaded, None if there was nothing to load
+        '''
+        check_output(output, resample, clean_na, store, compact)
+
+        logger.info(f'Make sure we are up to date')
+        await asyncio.get_running_loop().run_in_executor(None, self.__refresh__, max_date)
+
+        plan = self.__plan_requests__(min_date, max_date, limit, frequency, channels)
+        if plan is None:
+            return None
+
+        if type(store) == str:
+            store = ReadingsStore(store)
+
+        semaphore = asyncio.Semaphore(config._max_concurrent_requests)
+        async with client.async_session() as session:
+
+            tasks = []
+            for request in plan:
+                if output == 'pandas':
+                    tasks.append(asyncio.ensure_future(self.__get_sensor__(semaphore, session, request, resample, frequency, rename, store, keep_utc)))
+                else:
+                    tasks.append(asyncio.ensure_future(self.__get_arrays__(semaphore, session, request)))
+
+            dfs_sensor = await asyncio.gather(*tasks)
+
+        if output == 'pandas':
+            self.__make_data__(dfs_sensor, clean_na, compact)
+        else:
+            self.__make_output__(dfs_sensor, plan, rename, output, keep_utc, compact)
+
+        logger.info(f'Device {self.id} loaded successfully from API ({self.memory_usage / 2**20:.2f} MB)')
         return True
 
-    async def post_data(self, columns = 'sensors', rename = None, clean_na = 'drop', chunk_size = 500, dry_run = False, max_retries = 2, delay_between_posts = None):
+    async def iter_data(self,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        frequency: Optional[str] = '1Min',
+        resample: Optional[bool] = False,
+        channels: Optional[List[str]] = [],
+        rename: Optional[bool] = True,
+        buffer_size: Optional[int] = None,
+        keep_utc: Optional[bool] = False):
+        '''
+            Iterates over the device data from the SmartCitizen API, without
+            keeping it in memory. Yields one DataFrame per sensor and time
+            window (see config._max_rows_per_request) as they arrive, in no
+            particular order. self.data is not modified
+            Parameters
+            ----------
+                min_date, max_date, limit, frequency, resample, channels, rename, keep_utc
+                    Same as get_data
+                buffer_size: int
+                    None
+                    Maximum number of DataFrames waiting to be consumed. Requests
+                    pause while the buffer is full. Defaults to
+                    config._max_concurrent_requests
+            Returns
+            -------
+                Async iterator of DataFrames with a single column, indexed in
+                the device timezone (or UTC if keep_utc)
+        '''
+
+        logger.info(f'Make sure we are up to date')
+        await asyncio.get_running_loop().run_in_executor(None, self.__refresh__, max_date)
+
+        plan = self.__plan_requests__(min_date, max_date, limit, frequency, channels)
+        if plan is None:
+            return
+
+        windows = []
+        for request in plan:
+            split = self.__split_request__(request)
+            for n, window in enumerate(split):
+                # Windows share their boundaries, leave them to the next one
+                windows.append((window, split[n+1]['min_date'] if n < len(split) - 1 else None))
+        pending = iter(windows)
+
+        if buffer_size is None:
+            buffer_size = config._max_concurrent_requests
+        queue = asyncio.Queue(maxsize = buffer_size)
+        semaphore = asyncio.Semaphore(config._max_concurrent_requests)
+        done = object()
+
+        async with client.async_session() as session:
+
+            async def worker():
+                try:
+                    for window, end in pending:
+                        df_sensor = await self.__get_readings__(semaphore, session,
+                            self.__readings_url__(**window), self._headers, window['sensor_id'])
+                        if df_sensor is not None and end is not None:
+                            df_sensor = df_sensor[df_sensor.index < end]
+                        if df_sensor is None or df_sensor.empty:
+                            continue
+                        await queue.put(self.__format_readings__(df_sensor, window['sensor_id'],
+                            resample, frequency, rename, keep_utc))
+                except Exception as e:
+                    await queue.put(e)
+                    return
+                await queue.put(done)
+
+            workers = [asyncio.ensure_future(worker())
+                for _ in range(min(config._max_concurrent_requests, len(windows)))]
+            running = len(workers)
+
+            try:
+                while running:
+                    item = await queue.get()
+                    if item is done:
+                        running -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions = True)
+
+    async def post_data(self, columns = 'sensors', rename = None, clean_na = 'drop', chunk_size = 500, dry_run = False, max_retries = 2, delay_between_posts = None, max_chunks_in_flight = None, combined = False, max_values = None):
         '''
             POST self.data in the SmartCitizen API
             Parameters
@@ -388,6 +1022,22 @@ class SCDevice:
                 max_retries: int
                     2
                     Maximum number of retries per chunk
+                delay_between_posts: float
+                    None
+                    Seconds to wait before each post
+                max_chunks_in_flight: int
+                    None
+                    Maximum number of chunks being posted at the same time, for
+                    all columns. Defaults to config._max_concurrent_requests
+                combined: boolean
+                    False
+                    Post all columns together, with one payload per chunk
+                    containing all sensors at each timestamp, instead of one
+                    request per chunk and column
+                max_values: int
+                    None
+                    If combined, maximum number of values (rows x sensors) per
+                    chunk. Defaults to config._max_values_per_post
             Returns
             -------
                 True if the data was posted succesfully
@@ -426,9 +1076,17 @@ class SCDevice:
         else:
             _rename = rename
 
-        async with ClientSession() as session:
+        if max_chunks_in_flight is None:
+            max_chunks_in_flight = config._max_concurrent_requests
+        semaphore = asyncio.Semaphore(max_chunks_in_flight)
+
+        if combined and max_values is None:
+            max_values = config._max_values_per_post
+
+        async with client.async_session() as session:
 
             tasks = []
+            ids = dict()
             for column in _columns:
                 if column.name not in _rename:
                     logger.warning(f'{column.name} not in data')
@@ -439,6 +1097,10 @@ class SCDevice:
                 if column.id is None:
                     logger.warning(f'{column.name} has no id')
                     continue
+                if combined:
+                    logger.info(f'Adding {_rename[column.name]} ({column.id}) to post list')
+                    ids[_rename[column.name]] = column.id
+                    continue
                 # Get only post data
                 df = DataFrame(self.data[_rename[column.name]]).copy()
                 # Rename to ID to be able to post
@@ -446,15 +1108,24 @@ class SCDevice:
                 df.rename(columns={_rename[column.name]: column.id}, inplace = True)
                 url = f'{self.url}/readings'
                 # Append task
-                tasks.append(asyncio.ensure_future(self.post_datum(session, self._headers, url, df,
+                tasks.append(asyncio.ensure_future(self.post_datum(session, headers, url, df,
                     clean_na = clean_na, chunk_size = chunk_size, dry_run = dry_run,
-                    max_retries = max_retries, delay_between_posts=delay_between_posts)))
+                    max_retries = max_retries, delay_between_posts=delay_between_posts,
+                    semaphore = semaphore)))
+
+            if ids:
+                # All columns in the same payload, renamed to IDs
+                df = self.data[list(ids)].rename(columns=ids).copy()
+                tasks.append(asyncio.ensure_future(self.post_datum(session, headers, f'{self.url}/readings', df,
+                    clean_na = clean_na, chunk_size = chunk_size, dry_run = dry_run,
+                    max_retries = max_retries, delay_between_posts=delay_between_posts,
+                    semaphore = semaphore, max_values = max_values)))
 
             posts_ok = await asyncio.gather(*tasks)
 
         return not(False in posts_ok)
 
-    async def post_datum(self, session, headers, url, df, clean_na = 'drop', chunk_size = 500, dry_run = False, max_retries = 2, delay_between_posts = None):
+    async def post_datum(self, session, headers, url, df, clean_na = 'drop', chunk_size = 500, dry_run = False, max_retries = 2, delay_between_posts = None, semaphore = None, max_values = None):
         '''
             POST external pandas.DataFrame to the SmartCitizen API
             Parameters
@@ -478,6 +1149,17 @@ class SCDevice:
                 max_retries: int
                     2
                     Maximum number of retries per chunk
+                delay_between_posts: float
+                    None
+                    Seconds to wait before each post
+                semaphore: asyncio.Semaphore
+                    None
+                    Limits the chunks being posted at the same time. If None,
+                    one is made with config._max_concurrent_requests
+                max_values: int
+                    None
+                    Maximum number of non-null values per chunk, on top of
+                    chunk_size. Useful when df has several columns
             Returns
             -------
                 True if the data was posted succesfully
@@ -485,62 +1167,80 @@ class SCDevice:
         # Clean df of nans
         df = clean(df, clean_na, how = 'all')
         logger.info(f'Posting to {url}')
-        logger.info(f'Sensor ID: {list(df.columns)[0]}')
+        logger.info(f'Sensor ID: {", ".join(str(c) for c in df.columns)}')
         df.index.name = 'recorded_at'
 
         # Split the dataframe in chunks
-        chunked_dfs = [df[i:i+chunk_size] for i in range(0, df.shape[0], chunk_size)]
-        if len(chunked_dfs) > 1: logger.info(f'Splitting post in chunks of size {chunk_size}')
+        chunked_dfs = split_chunks(df, chunk_size, max_values)
+        if len(chunked_dfs) > 1: logger.info(f'Splitting post in {len(chunked_dfs)} chunks of up to {chunk_size} rows')
 
-        for i in trange(len(chunked_dfs), file=sys.stdout,
-                        desc=f"Posting data for {self.id}..."):
+        if dry_run:
+            if not chunked_dfs: return True
+            # Prepare json post
+            payload = make_readings_payload(chunked_dfs[0])
+            logger.info(f'Dry run request to: {self.url}/readings for chunk (1/{len(chunked_dfs)})')
+            jsd = dumps(payload, indent = 2, cls = NpEncoder)
+            logger.debug(jsd)
+            return jsd
+
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(config._max_concurrent_requests)
+
+        headers = dict(headers)
+        headers['Content-type']='application/json'
+        failed = asyncio.Event()
+        progress = tqdm(total=len(chunked_dfs), file=sys.stdout,
+            desc=f"Posting data for {self.id}...")
+
+        async def post_chunk(i):
+            async with semaphore:
+                # Do not start new chunks if one failed already
+                if failed.is_set():
+                    return False
 
-            chunk = chunked_dfs[i].copy()
+                with measure('POST', url) as event:
+                    # Prepare json post
+                    with event.timing('build_time'):
+                        payload = dumps(make_readings_payload(chunked_dfs[i]), cls = NpEncoder)
+
+                    post_ok = False
+                    retries = 0
+
+                    while post_ok == False and retries < max_retries:
+                        if delay_between_posts is not None:
+                            await asyncio.sleep(delay_between_posts)
+                        event.retries = retries
+                        event.bytes += len(payload)
+                        with event.timing('latency'):
+                            async with session.post(url, data = payload, headers = headers) as response:
+                                status = response.status
+                        event.status = status
+
+                        if status == 200 or status == 201:
+                            post_ok = True
+                            break
+                        else:
+                            retries += 1
+                            logger.warning (f'Chunk ({i+1}/{len(chunked_dfs)}) post failed. \
+                                    API responded {status}.\
+                                    Retrying ({retries}/{max_retries}')
+
+                if (not post_ok) or (retries == max_retries):
+                    logger.error (f'Chunk ({i+1}/{len(chunked_dfs)}) post failed. \
+                            API responded {status}.\
+                            Reached max_retries')
+                    failed.set()
+                    return False
 
-            # Prepare json post
-            payload = {"data":[]}
-            for item in chunk.index:
-                payload["data"].append(
-                    {
-                        "recorded_at": localise_date(item, 'UTC').strftime('%Y-%m-%dT%H:%M:%SZ'),
-                        "sensors": [{
-                            "id": column,
-                            "value": chunk.loc[item, column]
-                        } for column in chunk.columns if not isnan(chunk.loc[item, column])]
-                    }
-                )
-
-            if dry_run:
-                logger.info(f'Dry run request to: {self.url}/readings for chunk ({i+1}/{len(chunked_dfs)})')
-                jsd = dumps(payload, indent = 2, cls = NpEncoder)
-                logger.debug(jsd)
-                return jsd
-
-            post_ok = False
-            retries = 0
-
-            while post_ok == False and retries < max_retries:
-                if delay_between_posts is not None:
-                    time.sleep(delay_between_posts)
-                headers['Content-type']='application/json'
-                response = post(url, data = dumps(payload, cls = NpEncoder), headers = headers)
-
-                if response.status_code == 200 or response.status_code == 201:
-                    post_ok = True
-                    break
-                else:
-                    retries += 1
-                    logger.warning (f'Chunk ({i+1}/{len(chunked_dfs)}) post failed. \
-                            API responded {response.status_code}.\
-                            Retrying ({retries}/{max_retries}')
-
-            if (not post_ok) or (retries == max_retries):
-                logger.error (f'Chunk ({i+1}/{len(chunked_dfs)}) post failed. \
-                        API responded {response.status_code}.\
-                        Reached max_retries')
-                return False
+                progress.update()
+                return True
 
-        return True
+        try:
+            posts_ok = await asyncio.gather(*[post_chunk(i) for i in range(len(chunked_dfs))])
+        finally:
+            progress.close()
+
+        return not(False in posts_ok)
 
     def patch_postprocessing(self, dry_run = False):
         '''
@@ -569,7 +1269,7 @@ class SCDevice:
             return dumps(post)
 
         logger.info(f'Posting postprocessing_attributes:\n {post} to {self.url}')
-        response = patch(f'{self.url}/',
+        response = client.patch(f'{self.url}/',
                          data = dumps(post), headers = headers)
 
         if response.status_code == 200 or response.status_code == 201:
@@ -654,38 +1354,207 @@ class SCDevice:
     def data_policy(self):
         return self._data_policy
 
+    @property
+    def memory_usage(self):
+        '''
+            Bytes used by self.data, for any get_data output
+        '''
+        return get_memory_usage(self.data)
+
 def get_devices():
-    isn = True
-    result = list()
-    url = config.DEVICES_URL
-    while isn:
-        r = get(url)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        result += TypeAdapter(List[Device]).validate_python(r.json())
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
-    return result
+    return list(paginate(config.DEVICES_URL, Device))
 
 def get_world_map():
-    isn = True
+    return list(paginate(config.WORLD_MAP_URL, ReducedDevice))
+
+def get_timezones(devices: List) -> Dict:
+    """
+    Resolves the timezones of many devices at once, i.e. the result of
+    get_world_map. Each distinct location is only resolved once
+    Parameters
+    ----------
+        devices: list
+            Device, ReducedDevice or SCDevice instances
+    Returns
+    -------
+        Dict of {device_id: timezone}. Timezone is None if the device has
+        no location
+    """
+    locations = dict()
+    for device in devices:
+        if isinstance(device, SCDevice): device = device.json
+        location = device.location
+        if location is None or location.latitude is None or location.longitude is None:
+            locations[device.id] = None
+        else:
+            locations[device.id] = (location.latitude, location.longitude)
+
+    timezones = {location: get_timezone(*location) for location in set(locations.values()) if location is not None}
+    timezones[None] = None
+
+    return {id: timezones[location] for id, location in locations.items()}
+
+
+async def create_devices(ids: List,
+    check_postprocessing: Optional[bool] = True,
+    max_concurrent_requests: Optional[int] = None,
+    session = None,
+    semaphore = None,
+    lazy: Optional[bool] = False) -> List[SCDevice]:
+    """
+    Initialises several devices concurrently with SCDevice.create, sharing
+    the same session and concurrency limit. Devices that fail to load are
+    logged and skipped
+    Parameters
+    ----------
+        ids: list
+            Device IDs
+        check_postprocessing: bool
+            True
+            Same as in SCDevice
+        max_concurrent_requests: int
+            None
+            Maximum number of requests in flight. Defaults to config._max_concurrent_requests
+        session: aiohttp.ClientSession
+            None
+            Session to use. If None, one is made from the shared client
+        semaphore: asyncio.Semaphore
+            None
+            Semaphore to use. If None, one is made with max_concurrent_requests
+        lazy: bool
+            False
+            Same as in SCDevice
+    Returns
+    -------
+        List of SCDevice
+    """
+    if semaphore is None:
+        if max_concurrent_requests is None:
+            max_concurrent_requests = config._max_concurrent_requests
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    async def create(session):
+        return await asyncio.gather(*[SCDevice.create(id, check_postprocessing=check_postprocessing,
+            session=session, semaphore=semaphore, lazy=lazy) for id in ids], return_exceptions=True)
+
+    if session is None:
+        async with client.async_session() as session:
+            devices = await create(session)
+    else:
+        devices = await create(session)
+
     result = list()
-    url = config.WORLD_MAP_URL
-    while isn:
-        r = get(url)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        result += TypeAdapter(List[ReducedDevice]).validate_python(r.json())
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
+    for id, device in zip(ids, devices):
+        if isinstance(device, Exception):
+            logger.error(f'Device {id} could not be initialized: {device}')
+            continue
+        result.append(device)
+
+    return result
+
+def check_output(output: str, resample: bool, clean_na: Optional[str], store: Optional[ReadingsStore], compact: Optional[str] = None):
+    if output not in ['pandas', 'numpy', 'arrow']:
+        raise ValueError(f"output must be 'pandas', 'numpy' or 'arrow', not {output}")
+    if compact not in [None, 'float32', 'sparse']:
+        raise ValueError(f"compact must be None, 'float32' or 'sparse', not {compact}")
+    if output != 'pandas' and (resample or clean_na is not None or store is not None):
+        raise ValueError(f"resample, clean_na and store are not available with output='{output}'")
+
+async def get_fleet_data(devices: List,
+    min_date: Optional[datetime] = None,
+    max_date: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    frequency: Optional[str] = '1Min',
+    clean_na: Optional[str] = None,
+    resample: Optional[bool] = False,
+    channels: Optional[List[str]] = [],
+    rename: Optional[bool] = True,
+    combine: Optional[bool] = False,
+    max_concurrent_requests: Optional[int] = None,
+    store: Optional[ReadingsStore] = None,
+    output: Optional[str] = 'pandas',
+    keep_utc: Optional[bool] = False,
+    compact: Optional[str] = None):
+    """
+    Gets data for several devices at once. All the /readings requests for all
+    devices are planned up front and run in a single session, with a global
+    concurrency limit
+    Parameters
+    ----------
+        devices: list
+            Device IDs or SCDevice instances
+        min_date, max_date, limit, frequency, clean_na, resample, channels, rename, store, output, keep_utc, compact:
+            Same as in SCDevice.get_data
+        combine: bool
+            False
+            Return a single DataFrame indexed by (DEVICE, TIME) instead of a dict.
+            With output='arrow', a single table with a device column. Not
+            available with output='numpy'
+        max_concurrent_requests: int
+            None
+            Maximum number of requests in flight for the whole fleet.
+            Defaults to config._max_concurrent_requests
+    Returns
+    -------
+        Dict of {device_id: DataFrame}, or a DataFrame if combine
+    """
+    check_output(output, resample, clean_na, store, compact)
+    if combine and output == 'numpy':
+        raise ValueError("combine is not available with output='numpy'")
+
+    if max_concurrent_requests is None:
+        max_concurrent_requests = config._max_concurrent_requests
+
+    if type(store) == str:
+        store = ReadingsStore(store)
+
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    async with client.async_session() as session:
+
+        _devices = [device for device in devices if isinstance(device, SCDevice)]
+        # Make sure we are up to date, all at once
+        await asyncio.gather(*[device.__async_refresh__(session, semaphore, max_date) for device in _devices])
+        _devices += await create_devices([device for device in devices if not isinstance(device, SCDevice)],
+            check_postprocessing=False, session=session, semaphore=semaphore)
+
+        tasks = dict()
+        plans = dict()
+        for device in _devices:
+            plan = device.__plan_requests__(min_date, max_date, limit, frequency, channels)
+            if plan is None: continue
+
+            plans[device.id] = plan
+            if output == 'pandas':
+                tasks[device.id] = [asyncio.ensure_future(device.__get_sensor__(semaphore, session, request,
+                    resample, frequency, rename, store, keep_utc)) for request in plan]
+            else:
+                tasks[device.id] = [asyncio.ensure_future(device.__get_arrays__(semaphore, session, request))
+                    for request in plan]
+
+        logger.info(f'Requesting {sum(len(item) for item in tasks.values())} sensors for {len(tasks)} devices')
+        dfs_sensor = await asyncio.gather(*[asyncio.gather(*item) for item in tasks.values()])
+
+    _devices = {device.id: device for device in _devices}
+    result = dict()
+    for device_id, df_sensors in zip(tasks, dfs_sensor):
+        if output == 'pandas':
+            result[device_id] = _devices[device_id].__make_data__(df_sensors, clean_na, compact)
         else:
-            isn = False
+            result[device_id] = _devices[device_id].__make_output__(df_sensors, plans[device_id], rename, output, keep_utc, compact)
+
+    if combine and output == 'arrow':
+        import pyarrow as pa
+        if not result: return None
+        # Devices can be in different timezones, combine them in UTC
+        return pa.concat_tables([table
+            .set_column(1, 'timestamp', table['timestamp'].cast(pa.timestamp('ns', tz = 'UTC')))
+            .append_column('device', pa.array([device_id] * table.num_rows, type = pa.int64()))
+            for device_id, table in result.items()])
+
+    if combine:
+        if not result: return DataFrame()
+        # Devices can be in different timezones, combine them in UTC
+        return concat({device_id: df.tz_convert('UTC') if getattr(df.index, 'tz', None) is not None else df
+            for device_id, df in result.items()}, names=['DEVICE'])
+
     return result
@@ -1,9 +1,8 @@
-from smartcitizen_connector.models import Experiment
+from smartcitizen_connector.models import Experiment, get_adapter
 from smartcitizen_connector._config import config
 from smartcitizen_connector.tools import *
-from pydantic import TypeAdapter
 from typing import Optional, List
-from smartcitizen_connector.handler import HttpHandler
+from smartcitizen_connector.handler import HttpHandler, paginate
 
 # TODO - Can this inherit from experiment?
 class ExperimentHandler(HttpHandler):
@@ -14,7 +13,7 @@ class ExperimentHandler(HttpHandler):
 
         if self.id is not None:
             r = self.get()
-            self.model = TypeAdapter(Experiment).validate_python(r.json())
+            self.model = get_adapter(Experiment).validate_json(r.content)
         else:
             self.model = Experiment(**kwargs)
 
@@ -22,21 +21,4 @@ class ExperimentHandler(HttpHandler):
         return self.model.__getattribute__(attr)
 
 def get_experiments():
-    isn = True
-    result = list()
-    url = config.EXPERIMENTS_URL
-
-    while isn:
-        r = get(url)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        result += TypeAdapter(List[Experiment]).validate_python(r.json())
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
-
-    return result
+    return list(paginate(config.EXPERIMENTS_URL, Experiment))
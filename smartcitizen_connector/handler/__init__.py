@@ -1 +1 @@
-from .httphandler import HttpHandler
+from .httphandler import HttpHandler, iter_pages, async_iter_pages, paginate, async_paginate
\ No newline at end of file
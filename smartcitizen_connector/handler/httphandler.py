@@ -1,8 +1,19 @@
-from requests import get, patch, post, delete
 from os import environ
-from smartcitizen_connector.tools import logger
-from typing import Optional
+from smartcitizen_connector._config import config
+from smartcitizen_connector.tools import logger, process_headers
+from smartcitizen_connector.client import client
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice, chain
+from smartcitizen_connector.models import get_adapter
+from smartcitizen_connector.metrics import measure
+from typing import Optional, List, Any, Iterator, AsyncIterator, Callable, Union, TYPE_CHECKING
+import asyncio
 import json
+import re
+
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
 
 class HttpHandler:
     url: Optional[str] = None
@@ -30,31 +41,249 @@ class HttpHandler:
 
         return True
 
-    def get(self):
-        r = get(self.url)
-        r.raise_for_status()
+    def __request__(self, method: str, url: str, **kwargs):
+        with measure(method, url) as event:
+            with event.timing('latency'):
+                r = client.request(method, url, **kwargs)
+            event.status = r.status_code
+            event.bytes = len(r.content) if method == 'GET' else len(kwargs.get('data') or '')
+            r.raise_for_status()
         return r
 
+    def get(self):
+        return self.__request__('GET', self.url)
+
     def patch(self, property: str):
-        r = patch(self.url,
+        return self.__request__('PATCH', self.url,
             data=self.model.json(include=property,
                 exclude_none=True),
             headers = self.headers
         )
-        r.raise_for_status()
-        return r
 
     def post(self):
-        r = post(self.path,
+        return self.__request__('POST', self.path,
             data=self.model.json(exclude_none=True),
             headers = self.headers)
 
-        r.raise_for_status()
-        return r
-
     def delete(self):
-        r = delete(self.url,
+        return self.__request__('DELETE', self.url,
             headers = self.headers)
 
-        r.raise_for_status()
-        return r
+PAGE_PATTERN = re.compile(r'([?&])page=(\d+)')
+
+def get_page_urls(headers: dict) -> Optional[List[str]]:
+    """
+    Builds the urls of the remaining pages from the processed headers of a
+    list response (see process_headers)
+    Parameters
+    ----------
+        headers: dict
+            Result of process_headers
+    Returns
+    -------
+        List of urls from the next page to the last one, or None if they
+        can't be known
+    """
+    if 'next' not in headers or 'last' not in headers:
+        return None
+
+    next_page = PAGE_PATTERN.search(headers['next'])
+    last_page = PAGE_PATTERN.search(headers['last'])
+    if next_page is None or last_page is None:
+        return None
+
+    return [PAGE_PATTERN.sub(f'\\g<1>page={page}', headers['last'], count = 1)
+        for page in range(int(next_page.group(2)), int(last_page.group(2)) + 1)]
+
+def decode_page(content: bytes, decode: Union[bool, Callable]) -> Any:
+    if callable(decode):
+        return decode(content)
+    return json.loads(content) if decode else content
+
+def iter_pages(url: str, headers: Optional[dict] = None, max_workers: Optional[int] = None,
+    decode: Union[bool, Callable] = True) -> Iterator:
+    """
+    Iterates over the pages of a list endpoint, requesting them as they are
+    consumed. If the response links to the last page, up to max_workers pages
+    are requested ahead concurrently. Otherwise, they are followed one by one
+    with rel=next
+    Parameters
+    ----------
+        url: str
+            First page url
+        headers: dict
+            None
+            Request headers
+        max_workers: int
+            None
+            Maximum number of pages requested at the same time. Defaults to
+            config._max_concurrent_requests
+        decode: bool or callable
+            True
+            Decode the json content. If False, the raw bytes are returned.
+            If callable, it is applied to the raw bytes (i.e. the
+            validate_json of a TypeAdapter) along with the request
+    Returns
+    -------
+        Iterator with the json content of each page, in page order
+    """
+
+    def get_page(url):
+        with measure('GET', url) as event:
+            with event.timing('latency'):
+                r = client.get(url, headers = headers)
+            event.status = r.status_code
+            event.bytes = len(r.content)
+            r.raise_for_status()
+            with event.timing('parse_time'):
+                return decode_page(r.content, decode), process_headers(r.headers)
+
+    page, h = get_page(url)
+    yield page
+
+    urls = get_page_urls(h)
+    if urls:
+        if max_workers is None:
+            max_workers = config._max_concurrent_requests
+        logger.info(f'Requesting {len(urls)} more pages from {url}')
+        urls = iter(urls)
+        executor = ThreadPoolExecutor(max_workers = max_workers)
+        futures = deque(executor.submit(get_page, item) for item in islice(urls, max_workers))
+        try:
+            while futures:
+                page, _ = futures.popleft().result()
+                # Keep max_workers pages in flight
+                futures.extend(executor.submit(get_page, item) for item in islice(urls, 1))
+                yield page
+        finally:
+            for future in futures: future.cancel()
+            executor.shutdown(wait = False)
+        return
+
+    while 'next' in h and h['next'] != url:
+        url = h['next']
+        page, h = get_page(url)
+        yield page
+
+async def async_iter_pages(url: str, session: 'ClientSession', headers: Optional[dict] = None,
+    max_concurrent_requests: Optional[int] = None, decode: Union[bool, Callable] = True) -> AsyncIterator:
+    """
+    Same as iter_pages, with an aiohttp session
+    Parameters
+    ----------
+        url: str
+            First page url
+        session: aiohttp.ClientSession
+            Session to use
+        headers: dict
+            None
+            Request headers
+        max_concurrent_requests: int
+            None
+            Maximum number of pages requested at the same time. Defaults to
+            config._max_concurrent_requests
+        decode: bool or callable
+            True
+            Same as in iter_pages
+    Returns
+    -------
+        Async iterator with the json content of each page, in page order
+    """
+
+    async def get_page(url):
+        with measure('GET', url) as event:
+            with event.timing('latency'):
+                async with session.get(url, headers = headers) as response:
+                    event.status = response.status
+                    response.raise_for_status()
+                    content = await response.read()
+            event.bytes = len(content)
+            with event.timing('parse_time'):
+                return decode_page(content, decode), process_headers(response.headers)
+
+    page, h = await get_page(url)
+    yield page
+
+    urls = get_page_urls(h)
+    if urls:
+        if max_concurrent_requests is None:
+            max_concurrent_requests = config._max_concurrent_requests
+        logger.info(f'Requesting {len(urls)} more pages from {url}')
+        urls = iter(urls)
+        tasks = deque(asyncio.ensure_future(get_page(item)) for item in islice(urls, max_concurrent_requests))
+        try:
+            while tasks:
+                page, _ = await tasks.popleft()
+                # Keep max_concurrent_requests pages in flight
+                tasks.extend(asyncio.ensure_future(get_page(item)) for item in islice(urls, 1))
+                yield page
+        finally:
+            for task in tasks: task.cancel()
+        return
+
+    while 'next' in h and h['next'] != url:
+        url = h['next']
+        page, h = await get_page(url)
+        yield page
+
+def paginate(url: str, model: Any, headers: Optional[dict] = None, max_workers: Optional[int] = None) -> Iterator:
+    """
+    Iterates over the items of a list endpoint, validated as model, page by
+    page. Pages are only requested as the items are consumed, so the
+    iteration can be stopped early
+    Parameters
+    ----------
+        url: str
+            First page url
+        model: pydantic model
+            Model of each item (i.e. Device)
+        headers: dict
+            None
+            Request headers
+        max_workers: int
+            None
+            Same as in iter_pages
+    Returns
+    -------
+        Iterator of model
+    """
+    adapter = get_adapter(List[model])
+    # Validated straight from the raw bytes
+    yield from chain.from_iterable(iter_pages(url, headers = headers, max_workers = max_workers,
+        decode = adapter.validate_json))
+
+async def async_paginate(url: str, model: Any, session: Optional['ClientSession'] = None,
+    headers: Optional[dict] = None, max_concurrent_requests: Optional[int] = None) -> AsyncIterator:
+    """
+    Same as paginate, as an async iterator
+    Parameters
+    ----------
+        url: str
+            First page url
+        model: pydantic model
+            Model of each item (i.e. Device)
+        session: aiohttp.ClientSession
+            None
+            Session to use. If None, one is made from the shared client
+        headers: dict
+            None
+            Request headers
+        max_concurrent_requests: int
+            None
+            Same as in async_iter_pages
+    Returns
+    -------
+        Async iterator of model
+    """
+    if session is None:
+        async with client.async_session() as session:
+            async for item in async_paginate(url, model, session = session, headers = headers,
+                max_concurrent_requests = max_concurrent_requests):
+                yield item
+        return
+
+    adapter = get_adapter(List[model])
+    async for page in async_iter_pages(url, session, headers = headers,
+        max_concurrent_requests = max_concurrent_requests, decode = adapter.validate_json):
+        for item in page:
+            yield item
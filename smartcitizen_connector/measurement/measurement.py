@@ -1,9 +1,8 @@
-from smartcitizen_connector.models import Measurement
+from smartcitizen_connector.models import Measurement, get_adapter
 from smartcitizen_connector._config import config
 from smartcitizen_connector.tools import *
-from pydantic import TypeAdapter
 from typing import Optional, List
-from smartcitizen_connector.handler import HttpHandler
+from smartcitizen_connector.handler import HttpHandler, paginate
 
 # TODO - Can this inherit from Measurement?
 class MeasurementHandler(HttpHandler):
@@ -14,7 +13,7 @@ class MeasurementHandler(HttpHandler):
 
         if self.id is not None:
             r = self.get()
-            self.model = TypeAdapter(Measurement).validate_python(r.json())
+            self.model = get_adapter(Measurement).validate_json(r.content)
         else:
             self.model = Measurement(**kwargs)
 
@@ -22,20 +21,4 @@ class MeasurementHandler(HttpHandler):
         return self.model.__getattribute__(attr)
 
 def get_measurements():
-    isn = True
-    result = list()
-    url = config.MEASUREMENTS_URL
-    while isn:
-        r = get(url)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        result += TypeAdapter(List[Measurement]).validate_python(r.json())
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
-
-    return result
+    return list(paginate(config.MEASUREMENTS_URL, Measurement))
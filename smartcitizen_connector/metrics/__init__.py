@@ -0,0 +1 @@
+from .metrics import RequestEvent, Metrics, MetricsAggregator, metrics, measure, get_endpoint
\ No newline at end of file
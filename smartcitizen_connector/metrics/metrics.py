@@ -0,0 +1,229 @@
+from smartcitizen_connector._config import config
+from smartcitizen_connector._config.log import logger
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from collections import deque
+from urllib.parse import urlsplit
+from typing import Optional, Callable, List, Dict
+import threading
+import time
+import re
+
+ID_PATTERN = re.compile(r'/\d+(?=/|$)')
+
+def get_endpoint(url: str) -> str:
+    '''
+        Groups urls by endpoint: path without the query, with numeric ids
+        replaced. i.e. /v0/devices/{id}/readings
+    '''
+    return ID_PATTERN.sub('/{id}', urlsplit(url).path)
+
+@dataclass
+class RequestEvent:
+    '''
+        Metrics of a request to the API, emitted once it is done
+        Parameters
+        ----------
+            method: str
+                HTTP method
+            url: str
+                Requested url
+            endpoint: str
+                url grouped by endpoint (see get_endpoint)
+            status: int
+                None
+                Status code of the last response. None if there was none
+            latency: float
+                0
+                Seconds waiting for responses (all the attempts)
+            bytes: int
+                0
+                Bytes received (sent, for POST)
+            retries: int
+                0
+                Number of attempts after the first one
+            parse_time: float
+                0
+                Seconds decoding and validating the response
+            build_time: float
+                0
+                Seconds building DataFrames (or payloads, for POST)
+            error: str
+                None
+                Exception that ended the request, if any
+    '''
+    method: str
+    url: str
+    endpoint: str
+    status: Optional[int] = None
+    latency: float = 0
+    bytes: int = 0
+    retries: int = 0
+    parse_time: float = 0
+    build_time: float = 0
+    error: Optional[str] = None
+
+    @contextmanager
+    def timing(self, field: str):
+        '''
+            Adds the time spent in the block to field (i.e. 'parse_time')
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, field, getattr(self, field) + time.perf_counter() - start)
+
+# Event of the request being made in the current thread or asyncio task
+_current_event: ContextVar[Optional[RequestEvent]] = ContextVar('smartcitizen_connector_event', default = None)
+
+class Metrics:
+    '''
+        Registry of the callbacks that receive a RequestEvent for each
+        request of the connector. Callbacks are called in the thread (or
+        event loop) that made the request, so they should be fast. Errors in
+        callbacks are logged and ignored
+    '''
+
+    def __init__(self):
+        self.callbacks: List[Callable[[RequestEvent], None]] = list()
+
+    def add_callback(self, callback: Callable[[RequestEvent], None]):
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+        return callback
+
+    def remove_callback(self, callback: Callable[[RequestEvent], None]):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    def emit(self, event: RequestEvent):
+        for callback in list(self.callbacks):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception(f'Metrics callback {callback} failed')
+
+    @contextmanager
+    def collect(self, max_samples: Optional[int] = None):
+        '''
+            Aggregates the events of the requests made in the block
+            i.e.:
+                with metrics.collect() as aggregator:
+                    device.get_data()
+                print(aggregator.summary())
+        '''
+        aggregator = MetricsAggregator(max_samples = max_samples)
+        self.add_callback(aggregator)
+        try:
+            yield aggregator
+        finally:
+            self.remove_callback(aggregator)
+
+metrics = Metrics()
+
+@contextmanager
+def measure(method: str, url: str):
+    '''
+        Opens the RequestEvent of a request, and emits it at the end of the
+        block. Blocks nested in one for the same request (i.e. safe_get in a
+        caller that measures the parsing too) fill the same event
+    '''
+    event = _current_event.get()
+    if event is not None and event.method == method and event.url == url:
+        yield event
+        return
+
+    event = RequestEvent(method = method, url = url, endpoint = get_endpoint(url))
+    token = _current_event.set(event)
+    try:
+        yield event
+    except BaseException as exc:
+        event.error = repr(exc)
+        raise
+    finally:
+        _current_event.reset(token)
+        if metrics.callbacks: metrics.emit(event)
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    '''
+        q-th percentile (0-100) of values, interpolating between the closest
+        ranks. None if there are no values
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class MetricsAggregator:
+    '''
+        Metrics callback aggregating the events by method and endpoint: totals
+        and latency percentiles
+        Parameters
+        ----------
+            max_samples: int
+                config._metrics_max_samples
+                Latencies kept per endpoint for the percentiles (the latest ones)
+    '''
+
+    def __init__(self, max_samples: Optional[int] = None):
+        self.max_samples = max_samples or config._metrics_max_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._totals: Dict[str, Dict] = dict()
+            self._latencies: Dict[str, deque] = dict()
+
+    def __call__(self, event: RequestEvent):
+        key = f'{event.method} {event.endpoint}'
+        with self._lock:
+            if key not in self._totals:
+                self._totals[key] = {'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                    'latency': 0, 'parse_time': 0, 'build_time': 0}
+                self._latencies[key] = deque(maxlen = self.max_samples)
+            totals = self._totals[key]
+            totals['count'] += 1
+            if event.error is not None or event.status is None or event.status >= 400:
+                totals['errors'] += 1
+            for field in ['retries', 'bytes', 'latency', 'parse_time', 'build_time']:
+                totals[field] += getattr(event, field)
+            self._latencies[key].append(event.latency)
+
+    def summary(self) -> Dict[str, Dict]:
+        '''
+            Returns
+            -------
+                Dict {'METHOD endpoint': {'count', 'errors', 'retries', 'bytes',
+                'latency', 'parse_time', 'build_time', 'latency_p50', 'latency_p95'}}
+                Times are totals in seconds, except the percentiles
+        '''
+        with self._lock:
+            result = dict()
+            for key, totals in self._totals.items():
+                latencies = list(self._latencies[key])
+                result[key] = dict(totals,
+                    latency_p50 = percentile(latencies, 50),
+                    latency_p95 = percentile(latencies, 95))
+            return result
+
+    def totals(self) -> Dict:
+        '''
+            Same as summary, for all the endpoints together
+        '''
+        with self._lock:
+            result = {'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                'latency': 0, 'parse_time': 0, 'build_time': 0}
+            latencies = list()
+            for key, totals in self._totals.items():
+                for field in result:
+                    result[field] += totals[field]
+                latencies.extend(self._latencies[key])
+            result['latency_p50'] = percentile(latencies, 50)
+            result['latency_p95'] = percentile(latencies, 95)
+            return result
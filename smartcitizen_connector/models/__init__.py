@@ -1,3 +1,3 @@
 from .models import (Sensor, Measurement, Owner, User, Location, CalculatedChannel,
                      HardwareInfo, HardwarePostprocessing, Postprocessing,
-                     Data, Device, HardwareStatus, Policy, Experiment, ReducedDevice, Check)
\ No newline at end of file
+                     Data, Device, HardwareStatus, Policy, Experiment, ReducedDevice, Check, get_adapter)
\ No newline at end of file
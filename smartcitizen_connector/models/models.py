@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, Field
+from functools import lru_cache
 
 class Measurement(BaseModel):
     id: int
@@ -19,7 +20,7 @@ class CalculatedChannel(BaseModel):
     post: Optional[bool] = False
     args: Optional[dict] = None
     kwargs: Optional[dict] = None
-    depends_on: List[str] = []
+    depends_on: List[str] = Field(default_factory = list)
 
 class Check(BaseModel):
     name: str
@@ -43,8 +44,8 @@ class Sensor(BaseModel):
     value: Optional[float] = None
     prev_value: Optional[float] = None
     last_reading_at: Optional[datetime] = None
-    tags: Optional[List[str]] = []
-    default_key: Optional[str] = []
+    tags: Optional[List[str]] = Field(default_factory = list)
+    default_key: Optional[str] = Field(default_factory = list)
 
 class Owner(BaseModel):
     id: int
@@ -169,3 +170,17 @@ class User(BaseModel):
     updated_at: datetime
     forwarding_token: str
     forwarding_username: str
+
+@lru_cache(maxsize = None)
+def get_adapter(model: Any) -> TypeAdapter:
+    """
+    Shared TypeAdapter for a model or type (i.e. List[Device]). Adapters are
+    expensive to build, so each one is built once and reused
+    Parameters
+    ----------
+        model: pydantic model or type
+    Returns
+    -------
+        TypeAdapter
+    """
+    return TypeAdapter(model)
@@ -3,7 +3,7 @@ from smartcitizen_connector.tools import *
 from typing import Optional, List, Dict
 from pandas import DataFrame
 from os import environ
-from requests import get
+from smartcitizen_connector.handler import iter_pages
 
 def global_search(value: Optional[str] = None) -> DataFrame:
     """
@@ -33,22 +33,9 @@ def global_search(value: Optional[str] = None) -> DataFrame:
 
     url = config.API_SEARCH_URL  + f'{value}'
 
-    df = DataFrame()
-    isn = True
-    while isn:
-        r = get(url, headers = headers)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        df = df.combine_first(DataFrame(r.json()).set_index('id'))
+    pages = [DataFrame(page).set_index('id') for page in iter_pages(url, headers = headers)]
 
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
-
-    return df
+    return combine_frames(pages)
 
 def search_by_query(endpoint: Optional[str] = 'devices',
     search_items: List[Dict] = None) -> DataFrame:
@@ -112,21 +99,10 @@ def search_by_query(endpoint: Optional[str] = 'devices',
         url_queries += 1
 
 
-    df = DataFrame()
-    isn = True
+    pages = list()
     logger.info(f'Getting: {url}')
-    while isn:
-        r = get(url, headers = headers)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        if r.json() == []: return None
-        df = df.combine_first(DataFrame(r.json()).set_index('id'))
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
+    for page in iter_pages(url, headers = headers):
+        if page == []: return None
+        pages.append(DataFrame(page).set_index('id'))
 
-    return df
\ No newline at end of file
+    return combine_frames(pages)
\ No newline at end of file
@@ -1,9 +1,8 @@
-from smartcitizen_connector.models import Sensor
+from smartcitizen_connector.models import Sensor, get_adapter
 from smartcitizen_connector._config import config
 from smartcitizen_connector.tools import *
-from pydantic import TypeAdapter
 from typing import Optional, List
-from smartcitizen_connector.handler import HttpHandler
+from smartcitizen_connector.handler import HttpHandler, paginate
 
 class SensorHandler(HttpHandler):
 
@@ -13,7 +12,7 @@ class SensorHandler(HttpHandler):
 
         if self.id is not None:
             r = self.get()
-            self.model = TypeAdapter(Sensor).validate_python(r.json())
+            self.model = get_adapter(Sensor).validate_json(r.content)
         else:
             self.model = Sensor(**kwargs)
 
@@ -21,21 +20,4 @@ class SensorHandler(HttpHandler):
         return self.model.__getattribute__(attr)
 
 def get_sensors():
-    isn = True
-    result = list()
-    url = config.SENSORS_URL
-
-    while isn:
-        r = get(url)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        result += TypeAdapter(List[Sensor]).validate_python(r.json())
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
-
-    return result
+    return list(paginate(config.SENSORS_URL, Sensor))
@@ -0,0 +1 @@
+from .store import ReadingsStore, merge_coverage, missing_ranges
\ No newline at end of file
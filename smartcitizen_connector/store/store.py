@@ -0,0 +1,133 @@
+from smartcitizen_connector.tools import logger
+from pandas import DataFrame, read_parquet, to_datetime
+from typing import Optional, Dict, Tuple, List
+from json import loads, dumps
+from os import makedirs, replace
+from os.path import join, exists
+from shutil import rmtree
+
+def merge_coverage(coverage: List[Dict]) -> List[Dict]:
+    '''
+        Sorts the requested time ranges and merges the ones that overlap or
+        adjoin
+    '''
+    merged = list()
+    for interval in sorted(coverage, key = lambda item: item['from']):
+        if merged and interval['from'] <= merged[-1]['to']:
+            merged[-1]['to'] = max(merged[-1]['to'], interval['to'])
+        else:
+            merged.append(dict(interval))
+    return merged
+
+def missing_ranges(coverage: List[Dict], min_date, max_date) -> List[Tuple]:
+    '''
+        Time ranges between min_date and max_date that are not in coverage
+        Returns
+        -------
+            List of (from, to). If max_date is None, the last one is open
+            (to is None), as there can always be newer readings
+    '''
+    missing = list()
+    start = min_date
+    for interval in merge_coverage(coverage):
+        if max_date is not None and interval['from'] > max_date: break
+        if interval['to'] < start: continue
+        if interval['from'] > start:
+            missing.append((start, interval['from']))
+        start = max(start, interval['to'])
+
+    if max_date is None:
+        missing.append((start, None))
+    elif start < max_date:
+        missing.append((start, max_date))
+    return missing
+
+class ReadingsStore:
+    '''
+        Local store of readings in parquet format, partitioned by device and
+        sensor. Each partition keeps the readings in UTC for a rollup and the
+        time ranges that have been requested to the API for it, so that only
+        the missing ranges need to be requested again.
+        Needs pyarrow or fastparquet (pip install smartcitizen-connector[store])
+        Parameters
+        ----------
+            path: str
+                Directory of the store
+    '''
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+        except ImportError:
+            try:
+                import fastparquet
+            except ImportError:
+                raise ImportError('ReadingsStore needs pyarrow or fastparquet. Install it with: pip install smartcitizen-connector[store]')
+        self.path = path
+
+    def __partition__(self, device_id: int, sensor_id: int) -> str:
+        return join(self.path, f'device_id={device_id}', f'sensor_id={sensor_id}')
+
+    def load(self, device_id: int, sensor_id: int, rollup: str) -> Tuple[Optional[DataFrame], Optional[Dict]]:
+        '''
+            Loads the readings stored for a sensor
+            Returns
+            -------
+                (DataFrame, coverage) with the readings and the requested time
+                ranges ([{'from': Timestamp, 'to': Timestamp}, ...], sorted and
+                not overlapping), or (None, None)
+        '''
+        partition = self.__partition__(device_id, sensor_id)
+        if not exists(join(partition, f'{rollup}.json')):
+            return None, None
+
+        try:
+            with open(join(partition, f'{rollup}.json'), 'r') as file:
+                coverage = loads(file.read())
+            coverage = [{key: to_datetime(value, utc = True) for key, value in interval.items()}
+                for interval in coverage]
+            df = read_parquet(join(partition, f'{rollup}.parquet')).rename_axis(None)
+        except:
+            logger.warning(f'Could not load store for device {device_id}, sensor {sensor_id}. Ignoring it')
+            return None, None
+
+        logger.info(f'Device {device_id} - Loaded {len(df)} readings for sensor {sensor_id} from store')
+        return df, coverage
+
+    def save(self, device_id: int, sensor_id: int, rollup: str, df: DataFrame, coverage: Dict):
+        '''
+            Saves the readings for a sensor, replacing the previous ones
+            Parameters
+            ----------
+                df: DataFrame
+                    Readings in UTC
+                coverage: list
+                    Requested time ranges ([{'from': Timestamp, 'to': Timestamp}, ...]).
+                    Overlapping and adjoining ranges are merged
+        '''
+        partition = self.__partition__(device_id, sensor_id)
+        makedirs(partition, exist_ok = True)
+
+        # Write and then move, so that readers never find half written files
+        df.rename_axis('TIME').to_parquet(join(partition, f'{rollup}.parquet.tmp'))
+        replace(join(partition, f'{rollup}.parquet.tmp'), join(partition, f'{rollup}.parquet'))
+        with open(join(partition, f'{rollup}.json.tmp'), 'w') as file:
+            file.write(dumps([{key: value.isoformat() for key, value in interval.items()}
+                for interval in merge_coverage(coverage)]))
+        replace(join(partition, f'{rollup}.json.tmp'), join(partition, f'{rollup}.json'))
+
+        logger.info(f'Device {device_id} - Stored {len(df)} readings for sensor {sensor_id}')
+
+    def clear(self, device_id: Optional[int] = None, sensor_id: Optional[int] = None):
+        '''
+            Removes the store, or only the partitions of a device or sensor
+        '''
+        if device_id is None:
+            path = self.path
+        elif sensor_id is None:
+            path = join(self.path, f'device_id={device_id}')
+        else:
+            path = self.__partition__(device_id, sensor_id)
+
+        if exists(path):
+            rmtree(path)
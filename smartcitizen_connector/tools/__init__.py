@@ -1 +1,2 @@
-from .tools import *
\ No newline at end of file
+from .tools import *
+from .tools import __getattr__
\ No newline at end of file
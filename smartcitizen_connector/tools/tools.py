@@ -1,18 +1,17 @@
-from pandas import to_datetime
-from timezonefinder import TimezoneFinder
 from datetime import datetime
 from smartcitizen_connector._config import config
+from smartcitizen_connector._config.log import logger, CutsomLoggingFormatter
 from typing import Optional
 from termcolor import colored
-from requests.exceptions import HTTPError
-from requests import get
+from smartcitizen_connector.client import client
+from smartcitizen_connector.client.limiter import parse_retry_after
+from smartcitizen_connector.metrics import measure
 import re
 import logging
-import sys
 import time
+import asyncio
 from os import environ
-
-tf = TimezoneFinder()
+from functools import lru_cache
 
 freq_2_rollup_lut = (
     ['A', 'y'],
@@ -25,6 +24,19 @@ freq_2_rollup_lut = (
     ['ms', 'ms']
 )
 
+# Duration of each rollup unit in seconds. Calendar units are approximated
+# by their longest duration
+rollup_2_seconds_lut = (
+    ['y', 366*24*3600],
+    ['M', 31*24*3600],
+    ['w', 7*24*3600],
+    ['d', 24*3600],
+    ['h', 3600],
+    ['ms', 0.001],
+    ['m', 60],
+    ['s', 1]
+)
+
 def clean(df, clean_na = None, how = 'all'):
     """
     Helper function for cleaning nan in a pandas.   Parameters
@@ -46,6 +58,101 @@ def clean(df, clean_na = None, how = 'all'):
             df = df.fillna(method = 'bfill').fillna(method = 'ffill')
     return df
 
+def combine_frames(frames):
+    """
+    Combines DataFrames in a single pass. Same result as folding them with
+    DataFrame.combine_first, without re-aligning the accumulated DataFrame
+    for each of them
+    Parameters
+    ----------
+        frames: list
+            pandas.DataFrames to combine. None items are ignored
+    Returns
+    -------
+        DataFrame with the union of indexes and columns, with the first
+        non-null value of each cell
+    """
+    from pandas import DataFrame, concat
+    series = dict()
+    for frame in frames:
+        if frame is None: continue
+        # New columns are appended sorted, like in combine_first
+        for column in frame.columns.difference(list(series)).sort_values():
+            series[column] = list()
+        for column in frame.columns:
+            series[column].append(frame[column])
+
+    if not series:
+        return DataFrame()
+
+    columns = dict()
+    for column, items in series.items():
+        if len(items) == 1:
+            columns[column] = items[0]
+        else:
+            # Same column in several frames, take the first non-null value
+            columns[column] = concat(items).groupby(level=0, sort=True).first()
+
+    df = concat(columns, axis=1, sort=True)
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+
+    return df
+
+def compact_frame(df, sparse = False, max_density = None):
+    """
+    Reduces the memory of a readings DataFrame: float64 columns are cast to
+    float32 and, if sparse, the ones with a fraction of non-null values
+    below max_density become pandas sparse columns (only the non-null
+    values are stored)
+    Parameters
+    ----------
+        df: pandas.DataFrame
+        sparse: bool
+            False
+            Make low density columns sparse
+        max_density: float
+            config._sparse_max_density
+    Returns
+    -------
+        DataFrame with the same index and columns
+    """
+    from pandas import SparseDtype
+    from numpy import float32, nan
+    if df is None or df.empty:
+        return df
+    if max_density is None:
+        max_density = config._sparse_max_density
+
+    dtypes = dict()
+    for column, dtype in df.dtypes.items():
+        if dtype not in ('float64', 'float32'): continue
+        if sparse and df[column].count() < max_density * len(df):
+            dtypes[column] = SparseDtype(float32, nan)
+        else:
+            dtypes[column] = float32
+    if not dtypes:
+        return df
+    return df.astype(dtypes)
+
+def get_memory_usage(data):
+    """
+    Memory used by the data of a device (any get_data output)
+    Parameters
+    ----------
+        data: pandas.DataFrame, dict of (timestamps, values) arrays or pyarrow.Table
+    Returns
+    -------
+        Bytes
+    """
+    if data is None:
+        return 0
+    if isinstance(data, dict):
+        return sum(timestamps.nbytes + values.nbytes for timestamps, values in data.values())
+    if hasattr(data, 'memory_usage'):
+        return int(data.memory_usage(index = True, deep = True).sum())
+    return data.nbytes
+
 def convert_freq_to_rollup(freq):
     """
     Helper function for converting a pandas freq into a rollup of SC API's
@@ -77,6 +184,230 @@ def convert_freq_to_rollup(freq):
     rollup = rollup_value + rollup_unit
     return rollup
 
+def convert_rollup_to_seconds(rollup):
+    """
+    Helper function for converting a rollup of SC API's into seconds
+    ----------
+        rollup: str rollup from SC
+    Returns
+    -------
+        seconds: float or None if the rollup is not valid
+    """
+    if rollup is None:
+        return None
+
+    for item in rollup_2_seconds_lut:
+        if rollup.endswith(item[0]):
+            rollup_value = rollup[:-len(item[0])]
+            try:
+                return (int(rollup_value) if rollup_value else 1) * item[1]
+            except ValueError:
+                return None
+    return None
+
+def split_time_windows(min_date, max_date, rollup, max_rows, max_windows = None):
+    """
+    Splits a time range in consecutive windows that contain at most max_rows
+    readings at the given rollup, and at most max_windows windows
+    Parameters
+    ----------
+        min_date: pandas.Timestamp
+            Start of the range
+        max_date: pandas.Timestamp
+            End of the range
+        rollup: str
+            Rollup from SC
+        max_rows: int
+            Maximum number of readings per window
+        max_windows: int
+            None
+            Maximum number of windows. If the range needs more, the windows
+            are made wider (with more than max_rows readings)
+    Returns
+    -------
+        List of (start, end) tuples. Consecutive windows share their boundary
+    """
+    from pandas import Timedelta
+    seconds = convert_rollup_to_seconds(rollup)
+    if seconds is None or max_rows is None or min_date >= max_date:
+        return [(min_date, max_date)]
+
+    span = Timedelta(seconds = seconds * max_rows)
+    if max_windows is not None:
+        # Rounded up, so that there are never more than max_windows
+        span = max(span, -((min_date - max_date) // max_windows))
+    windows = list()
+    start = min_date
+    while start < max_date:
+        end = min(start + span, max_date)
+        windows.append((start, end))
+        start = end
+
+    return windows
+
+def sort_readings(timestamps, values):
+    """
+    Sorts readings by timestamp and removes the duplicated timestamps,
+    keeping the first one
+    Parameters
+    ----------
+        timestamps: numpy.ndarray
+            int64 nanoseconds since epoch (UTC)
+        values: numpy.ndarray
+    Returns
+    -------
+        Tuple (timestamps, values)
+    """
+    from numpy import argsort, empty
+    order = argsort(timestamps, kind = 'stable')
+    timestamps, values = timestamps[order], values[order]
+    unique = empty(len(timestamps), dtype = bool)
+    unique[:1] = True
+    unique[1:] = timestamps[1:] != timestamps[:-1]
+    return timestamps[unique], values[unique]
+
+# Format of the timestamps of the API, i.e. 2024-01-01T00:00:00Z
+API_DATE_LENGTH = 20
+
+def parse_timestamps(dates):
+    """
+    Parses the timestamps of the API into int64 nanoseconds since epoch (UTC)
+    in a single vectorised step. The API always sends them in the same
+    format (%Y-%m-%dT%H:%M:%SZ), which numpy parses directly without format
+    inference. Any other format falls back to pandas.to_datetime
+    Parameters
+    ----------
+        dates: list
+            Date strings
+    Returns
+    -------
+        numpy.ndarray of int64
+    """
+    from numpy import asarray
+    dates = asarray(dates, dtype = str)
+    if dates.dtype.itemsize == 4 * API_DATE_LENGTH and len(dates):
+        # All of them are 20 characters long and end in Z
+        if (dates.view('U1').reshape(-1, API_DATE_LENGTH)[:, -1] == 'Z').all():
+            try:
+                return dates.astype(f'U{API_DATE_LENGTH - 1}').astype('datetime64[ns]').view('int64')
+            except ValueError:
+                pass
+
+    from pandas import to_datetime
+    timestamps = to_datetime(dates, utc = True)
+    # pandas >= 2 can parse them in other resolutions (i.e. us)
+    if hasattr(timestamps, 'as_unit'): timestamps = timestamps.as_unit('ns')
+    return timestamps.asi8
+
+def parse_readings(readings):
+    """
+    Decodes the readings of the API straight into arrays, without a DataFrame
+    Parameters
+    ----------
+        readings: list
+            [[timestamp, value], ...] as returned by the API
+    Returns
+    -------
+        Tuple (timestamps, values): int64 nanoseconds since epoch (UTC) and
+        float64 values (object if they are not numeric), sorted and without
+        duplicated timestamps
+    """
+    from numpy import asarray
+    dates, values = zip(*readings)
+    timestamps = parse_timestamps(dates)
+    try:
+        values = asarray(values, dtype = float)
+    except (TypeError, ValueError):
+        values = asarray(values, dtype = object)
+    return sort_readings(timestamps, values)
+
+def merge_readings(arrays):
+    """
+    Merges the arrays of several parse_readings (i.e. time windows of the
+    same sensor), keeping the first reading of each timestamp
+    Parameters
+    ----------
+        arrays: list
+            Tuples (timestamps, values)
+    Returns
+    -------
+        Tuple (timestamps, values)
+    """
+    from numpy import concatenate
+    if len(arrays) == 1:
+        return arrays[0]
+    return sort_readings(concatenate([item[0] for item in arrays]),
+        concatenate([item[1] for item in arrays]))
+
+def make_readings_payload(df):
+    """
+    Builds the payload to POST readings in the SC API from a DataFrame
+    Parameters
+    ----------
+        df: pandas.DataFrame
+            Readings with sensor ids as columns, and timestamps as index.
+            Timestamps are converted to UTC (or considered UTC if not tz-aware)
+    Returns
+    -------
+        Dict {"data": [{"recorded_at": str, "sensors": [{"id": id, "value": value}]}]}
+        NaN values are not included
+    """
+    from numpy import char
+    # Same as strftime('%Y-%m-%dT%H:%M:%SZ'), in a single numpy operation
+    recorded_at = localise_date(df.index, 'UTC').tz_localize(None).to_numpy().astype('datetime64[s]')
+    recorded_at = char.add(recorded_at.astype(str), 'Z').tolist()
+
+    # Column by column to keep each column's dtype
+    columns = df.columns.tolist()
+    values = [df[column].to_numpy().tolist() for column in columns]
+    valid = [df[column].notna().to_numpy().tolist() for column in columns]
+
+    data = list()
+    for timestamp, row, row_valid in zip(recorded_at, zip(*values), zip(*valid)):
+        data.append({
+            "recorded_at": timestamp,
+            "sensors": [{
+                "id": column,
+                "value": value
+            } for column, value, ok in zip(columns, row, row_valid) if ok]
+        })
+
+    return {"data": data}
+
+def split_chunks(df, chunk_size, max_values = None):
+    """
+    Splits a DataFrame in chunks of rows to be posted
+    Parameters
+    ----------
+        df: pandas.DataFrame
+            Readings with sensor ids as columns
+        chunk_size: int
+            Maximum number of rows per chunk
+        max_values: int
+            None
+            Maximum number of non-null values per chunk. A chunk always
+            has at least one row
+    Returns
+    -------
+        List of DataFrames
+    """
+    from numpy import cumsum, searchsorted
+    n = df.shape[0]
+    if max_values is None:
+        return [df[i:i+chunk_size] for i in range(0, n, chunk_size)]
+
+    # Cumulative number of values at the end of each row
+    total = cumsum(df.notna().sum(axis = 1).to_numpy())
+    chunks = list()
+    start = 0
+    while start < n:
+        done = total[start-1] if start else 0
+        end = start + max(1, int(searchsorted(total[start:start+chunk_size], done + max_values, side = 'right')))
+        chunks.append(df[start:end])
+        start = end
+
+    return chunks
+
 def localise_date(date, timezone, tzaware=True):
     """
     Localises a date if it's tzinfo is None, otherwise converts it to it.
@@ -91,6 +422,7 @@ def localise_date(date, timezone, tzaware=True):
     -------
         The date converted to 'UTC' and localised based on the timezone
     """
+    from pandas import to_datetime
     if date is not None:
         # Per default, we consider that timestamps are tz-aware or UTC.
         # If not, preprocessing should be done to get there
@@ -104,35 +436,41 @@ def localise_date(date, timezone, tzaware=True):
 
     return result_date
 
-class CutsomLoggingFormatter(logging.Formatter):
-
-    grey = "\x1b[38;20m"
-    yellow = "\x1b[33;20m"
-    red = "\x1b[31;20m"
-    bold_red = "\x1b[31;1m"
-    reset = "\x1b[0m"
-    format_min = "[%(asctime)s] - %(name)s - %(levelname)s - %(message)s"
-    format_deb = "[%(asctime)s] - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
-
-    FORMATS = {
-        logging.DEBUG: grey + format_min + reset,
-        logging.INFO: grey + format_min + reset,
-        logging.WARNING: yellow + format_min + reset,
-        logging.ERROR: red + format_deb + reset,
-        logging.CRITICAL: bold_red + format_deb + reset
-    }
-
-    def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
-
-logger = logging.getLogger('smartcitizen_connector')
-logger.setLevel(config.log_level)
-ch = logging.StreamHandler(sys.stdout)
-ch.setLevel(config.log_level)
-ch.setFormatter(CutsomLoggingFormatter())
-logger.addHandler(ch)
+@lru_cache(maxsize = None)
+def get_timezone_finder():
+    """
+    Shared TimezoneFinder, only loaded the first time it is needed
+    """
+    from timezonefinder import TimezoneFinder
+    return TimezoneFinder()
+
+def __getattr__(name):
+    # tf (the TimezoneFinder) used to be made on import. Still available, lazily
+    if name == 'tf':
+        return get_timezone_finder()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+@lru_cache(maxsize = config._timezone_cache_maxsize)
+def timezone_at(latitude, longitude):
+    return get_timezone_finder().timezone_at(lng = longitude, lat = latitude)
+
+def get_timezone(latitude, longitude):
+    """
+    Gets the timezone name at a location. Results are memoised on the
+    coordinates rounded to config._timezone_precision decimals
+    Parameters
+    ----------
+        latitude: float
+        longitude: float
+    Returns
+    -------
+        Timezone name (i.e. 'Europe/Madrid') or None if the location is unknown
+    """
+    if latitude is None or longitude is None:
+        return None
+
+    return timezone_at(round(latitude, config._timezone_precision),
+        round(longitude, config._timezone_precision))
 
 def get_request_headers():
     # Headers for requests
@@ -177,21 +515,59 @@ def process_headers(headers):
                     result['first'] = chunk[0].strip('<').strip('>')
     return result
 
+def retry_interval(code, headers = None):
+    # Throttling (429) is handled by the client rate limiter, that slows
+    # down and pauses all the requests for Retry-After, not only this one.
+    # Without a usable Retry-After, the retry waits as for any other error
+    if code == 429 and client.limiter.enabled:
+        if parse_retry_after(headers.get('Retry-After') if headers is not None else None):
+            return 0
+    return config._retry_interval
+
 def safe_get(url, headers = None):
-    for n in range(config._max_retries):
-        try:
-            r = get(url, headers = headers)
-            r.raise_for_status()
-        except HTTPError as exc:
-            code = exc.response.status_code
-            if code in config._retry_codes:
-                time.sleep(config._retry_interval)
-                continue
-            raise
-        else:
-            break
+    from requests.exceptions import HTTPError
+    with measure('GET', url) as event:
+        for n in range(config._max_retries):
+            if n: event.retries += 1
+            try:
+                with event.timing('latency'):
+                    r = client.get(url, headers = headers)
+                event.status = r.status_code
+                r.raise_for_status()
+            except HTTPError as exc:
+                code = exc.response.status_code
+                if code in config._retry_codes:
+                    time.sleep(retry_interval(code, exc.response.headers))
+                    continue
+                raise
+            else:
+                break
+        event.bytes += len(r.content)
     return r
 
+async def async_safe_fetch(session, url, headers = None):
+    from aiohttp import ClientResponseError
+    with measure('GET', url) as event:
+        for n in range(config._max_retries):
+            if n: event.retries += 1
+            try:
+                with event.timing('latency'):
+                    async with session.get(url, headers = headers, raise_for_status = True) as r:
+                        event.status = r.status
+                        content = await r.read()
+                event.bytes += len(content)
+                return r.status, r.headers, content
+            except ClientResponseError as exc:
+                event.status = exc.status
+                if exc.status in config._retry_codes and n < config._max_retries - 1:
+                    await asyncio.sleep(retry_interval(exc.status, exc.headers))
+                    continue
+                raise
+
+async def async_safe_get(session, url, headers = None):
+    _, _, content = await async_safe_fetch(session, url, headers = headers)
+    return content
+
 def get_alphasense(slot, sensor_id):
     result = list()
 
@@ -1,9 +1,8 @@
-from smartcitizen_connector.models import User
+from smartcitizen_connector.models import User, get_adapter
 from smartcitizen_connector._config import config
 from smartcitizen_connector.tools import *
-from pydantic import TypeAdapter
 from typing import Optional, List
-from smartcitizen_connector.handler import HttpHandler
+from smartcitizen_connector.handler import HttpHandler, paginate
 
 class UserHandler(HttpHandler):
 
@@ -14,10 +13,10 @@ class UserHandler(HttpHandler):
 
         if self.id is not None:
             r = self.get()
-            self.model = TypeAdapter(User).validate_python(r.json())
+            self.model = get_adapter(User).validate_json(r.content)
         elif self.name is not None:
             r = self.get()
-            self.model = TypeAdapter(User).validate_python(r.json())
+            self.model = get_adapter(User).validate_json(r.content)
         else:
             self.model = User(**kwargs)
 
@@ -25,19 +24,4 @@ class UserHandler(HttpHandler):
         return self.model.__getattribute__(attr)
 
 def get_users():
-    isn = True
-    result = list()
-    url = config.USERS_URL
-    while isn:
-        r = get(url)
-        r.raise_for_status()
-        # If status code OK, retrieve data
-        h = process_headers(r.headers)
-        result += TypeAdapter(List[User]).validate_python(r.json())
-
-        if 'next' in h:
-            if h['next'] == url: isn = False
-            elif h['next'] != url: url = h['next']
-        else:
-            isn = False
-    return result
+    return list(paginate(config.USERS_URL, User))
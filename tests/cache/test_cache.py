@@ -0,0 +1,102 @@
+import pytest
+from smartcitizen_connector.cache import ResourceCache
+from smartcitizen_connector.client import client
+from typing import List
+import asyncio
+
+def counts(api):
+    # Requests, and how many of them got a 304
+    values = api.get_counts()
+    return values['requests'], values['not_modified']
+
+def test_lru(api):
+    cache = ResourceCache(maxsize = 2, ttl = 3600)
+    a, b, c = [f'{api.url}resources/{name}' for name in 'abc']
+
+    cache.get_json(a)
+    cache.get_json(b)
+    cache.get_json(a)
+    # b is the least recently used
+    cache.get_json(c)
+
+    requests, _ = counts(api)
+    cache.get_json(a)
+    cache.get_json(c)
+    assert counts(api)[0] == requests
+    cache.get_json(b)
+    assert counts(api)[0] == requests + 1
+
+def test_revalidation(api):
+    cache = ResourceCache(ttl = 3600)
+    url = f'{api.url}resources/blueprint'
+
+    assert cache.get_model(url, List[str], 'channels') == ['Channel 0']
+    entry = cache.__get_entry__(url)
+
+    # Fresh: no requests
+    requests, not_modified = counts(api)
+    cache.get_json(url)
+    assert counts(api) == (requests, not_modified)
+
+    # Expired and unchanged: 304, and the entry (with its models) is kept
+    cache._ttl = 0
+    assert cache.get_model(url, List[str], 'channels') == ['Channel 0']
+    assert counts(api) == (requests + 1, not_modified + 1)
+    assert cache.__get_entry__(url) is entry
+
+    # Only by Last-Modified
+    entry['etag'] = None
+    cache.get_json(url)
+    assert counts(api) == (requests + 2, not_modified + 2)
+
+    # Changed
+    api.configure(resource_version = 2)
+    assert cache.get_model(url, List[str], 'channels') == ['Channel 0', 'Channel 1']
+    assert counts(api) == (requests + 3, not_modified + 2)
+
+def test_disk(api, tmp_path):
+    url = f'{api.url}resources/blueprint'
+    json = ResourceCache(path = str(tmp_path)).get_json(url)
+
+    # Read from disk by another cache
+    requests, not_modified = counts(api)
+    cache = ResourceCache(path = str(tmp_path), ttl = 3600)
+    assert cache.get_json(url) == json
+    assert counts(api) == (requests, not_modified)
+
+    # With the validators of the stored response
+    cache = ResourceCache(path = str(tmp_path), ttl = 0)
+    assert cache.get_json(url) == json
+    assert counts(api) == (requests + 1, not_modified + 1)
+
+def test_async(api):
+    api.configure(latency = 0.2)
+    cache = ResourceCache(ttl = 3600)
+    url = f'{api.url}resources/blueprint'
+
+    async def get_json():
+        async with client.async_session() as session:
+            return await asyncio.gather(*[cache.async_get_json(url, session) for _ in range(5)])
+
+    requests, _ = counts(api)
+    jsons = asyncio.run(get_json())
+    # Only one request in flight per url
+    assert counts(api)[0] == requests + 1
+    assert all(json == jsons[0] for json in jsons)
+    assert len(set(map(id, jsons))) == 5
+
+    cache._ttl = 0
+    asyncio.run(get_json())
+    assert counts(api)[0] == requests + 2
+
+def test_copies(api):
+    cache = ResourceCache(ttl = 3600)
+    url = f'{api.url}resources/blueprint'
+
+    json = cache.get_json(url)
+    json['channels'].append('Modified')
+    assert cache.get_json(url)['channels'] == ['Channel 0']
+
+    channels = cache.get_model(url, List[str], 'channels')
+    channels.append('Modified')
+    assert cache.get_model(url, List[str], 'channels') == ['Channel 0']
@@ -0,0 +1,73 @@
+import pytest
+from smartcitizen_connector.client import HttpArchive
+from smartcitizen_connector.client.archive import make_key
+from requests import Response
+from aiohttp import ClientSession
+import asyncio
+import gzip
+import json
+
+URL = 'https://api.smartcitizen.me/v0/devices/1/readings'
+
+def test_make_key():
+    assert make_key('get', f'{URL}?sensor_id=1&rollup=1m&from=2024-01-01&to=2024-01-02') == \
+        make_key('GET', f'{URL}?to=2024-01-02&from=2024-01-01&rollup=1m&sensor_id=1')
+    assert make_key('POST', URL, data = '{"data": []}') != make_key('POST', URL, data = '{"data": [1]}')
+
+def send(method, url, **kwargs):
+    r = Response()
+    r.status_code = 404 if 'missing' in url else 200
+    r.headers['Content-type'] = 'application/json'
+    r._content = b'{"id": 1}'
+    r.url = url
+    return r
+
+def test_record_replay(tmp_path):
+    path = str(tmp_path / 'archive.jsonl.gz')
+    archive = HttpArchive(path, 'record')
+    archive.request(send, 'GET', f'{URL}?sensor_id=1&rollup=1m')
+    archive.request(send, 'GET', f'{URL}/missing')
+    archive.close()
+
+    archive = HttpArchive(path, 'replay')
+    # Errors are not recorded
+    assert len(archive) == 1
+    r = archive.request(None, 'GET', f'{URL}?rollup=1m&sensor_id=1')
+    assert r.json() == {'id': 1}
+    with pytest.raises(KeyError):
+        archive.request(None, 'GET', f'{URL}?sensor_id=2&rollup=1m')
+
+    async def replay():
+        async with archive.wrap(ClientSession()) as session:
+            async with session.get(f'{URL}?rollup=1m&sensor_id=1', raise_for_status = True) as response:
+                assert response.status == 200
+                assert await response.json() == {'id': 1}
+
+    asyncio.run(replay())
+    assert archive.hits == 2
+
+def test_not_recorded_errors(tmp_path):
+    path = str(tmp_path / 'archive.jsonl.gz')
+    statuses = [429, 503, 200]
+    calls = list()
+
+    def throttled(method, url, **kwargs):
+        r = send(method, url)
+        r.status_code = statuses[len(calls)]
+        calls.append(url)
+        return r
+
+    archive = HttpArchive(path, 'auto')
+    # Retries of a transient error reach the API until it succeeds
+    assert [archive.request(throttled, 'GET', URL).status_code for _ in range(4)] == [429, 503, 200, 200]
+    assert len(calls) == 3
+    archive.close()
+
+    # Errors in archives recorded before are not replayed either
+    with gzip.open(path, 'at', encoding = 'utf-8') as file:
+        file.write(json.dumps({'key': make_key('GET', f'{URL}/2'), 'method': 'GET', 'url': f'{URL}/2',
+            'status': 429, 'headers': [], 'body': '', 'encoding': None}) + '\n')
+    archive = HttpArchive(path, 'replay')
+    assert archive.request(None, 'GET', URL).status_code == 200
+    with pytest.raises(KeyError):
+        archive.request(None, 'GET', f'{URL}/2')
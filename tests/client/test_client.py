@@ -0,0 +1,25 @@
+import pytest
+from smartcitizen_connector import SCDevice
+from smartcitizen_connector.client import client
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+def test_connector_per_loop(api):
+    async def get_data():
+        d = SCDevice(1, check_postprocessing = False)
+        await d.get_data(min_date = '2024-01-01')
+        await d.get_data(min_date = '2024-01-01')
+        return d.data.shape, client.connector
+
+    def run(_):
+        return [asyncio.run(get_data()) for _ in range(3)]
+
+    # Each thread runs its own loops, at the same time
+    with ThreadPoolExecutor(2) as executor:
+        results = sum(executor.map(run, range(2)), [])
+
+    assert [shape for shape, _ in results] == [(1440, 5)] * 6
+    connectors = [connector for _, connector in results]
+    assert len(set(map(id, connectors))) == 6
+    # Closed when their loop finished
+    assert all(connector.closed for connector in connectors)
@@ -0,0 +1,33 @@
+import pytest
+from smartcitizen_connector.client import RateLimiter
+from smartcitizen_connector.client.limiter import parse_retry_after
+import asyncio
+import time
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate = 10, burst = 2, min_rate = 1, max_rate = 20, backoff = 0.5, increase = 1)
+
+    limiter.update(200)
+    assert limiter.rate == 11
+
+    # Throttled requests from the same burst only slow down once
+    limiter.update(429, {'Retry-After': '0.2'})
+    limiter.update(429)
+    assert limiter.rate == 5.5
+    assert limiter.throttled == 2
+
+    start = time.monotonic()
+    limiter.acquire()
+    asyncio.run(limiter.async_acquire())
+    assert time.monotonic() - start >= 0.2
+    assert limiter.queue_depth == 0
+
+    disabled = RateLimiter(rate = 0)
+    disabled.update(429)
+    assert disabled.rate is None
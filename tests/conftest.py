@@ -0,0 +1,35 @@
+import pytest
+import os
+import sys
+
+# Stand-in API of the benchmarks, to run the tests without network access
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from server import StandInAPI, DEFAULTS
+from smartcitizen_connector._config import config
+from smartcitizen_connector.client import client, RateLimiter
+
+URLS = ['API_URL', 'DEVICES_URL', 'WORLD_MAP_URL', 'SENSORS_URL', 'MEASUREMENTS_URL',
+    'EXPERIMENTS_URL', 'USERS_URL', 'API_SEARCH_URL']
+
+@pytest.fixture(scope = 'session')
+def stand_in_api():
+    api = StandInAPI()
+    api.start()
+    yield api
+    api.stop()
+
+@pytest.fixture
+def api(stand_in_api, monkeypatch):
+    '''
+        Points the connector to the stand-in API (see benchmarks/server.py),
+        with the default settings, its counts reset and a new rate limiter.
+        Returns the StandInAPI, to configure it
+    '''
+    stand_in_api.configure(**DEFAULTS)
+    stand_in_api.reset_counts()
+    monkeypatch.setenv('API_URL', stand_in_api.url)
+    base = config.API_URL
+    for name in URLS:
+        monkeypatch.setattr(config, name, getattr(config, name).replace(base, stand_in_api.url))
+    monkeypatch.setattr(client, 'limiter', RateLimiter())
+    return stand_in_api
@@ -0,0 +1,17 @@
+import pytest
+from smartcitizen_connector import SCDevice, create_devices
+import asyncio
+
+def test_create(api):
+    id = 2
+    uuid = "uuid-2"
+
+    d = asyncio.run(SCDevice.create(id))
+    s = SCDevice(id)
+    ds = asyncio.run(create_devices([id, id], check_postprocessing = False))
+
+    assert d.json.id == id
+    assert d.json.uuid == uuid
+    assert d.timezone == s.timezone == 'America/New_York'
+    assert d.sensors == s.sensors
+    assert [item.json.uuid for item in ds] == [uuid, uuid]
@@ -0,0 +1,49 @@
+import pytest
+from smartcitizen_connector import SCDevice, get_fleet_data
+from smartcitizen_connector._config import config
+import asyncio
+
+def test_fleet(api):
+    # Europe/London and America/New_York
+    ids = [1, 2]
+    frequency = '1H'
+    min_date = '2024-01-01T00:00:00Z'
+    max_date = '2024-01-01T12:00:00Z'
+
+    data = asyncio.run(get_fleet_data(ids,
+        min_date = min_date,
+        max_date = max_date,
+        frequency = frequency)
+    )
+
+    combined = asyncio.run(get_fleet_data(ids,
+        min_date = min_date,
+        max_date = max_date,
+        frequency = frequency,
+        combine = True)
+    )
+
+    assert set(data.keys()) == set(ids)
+    assert str(data[1].index.tz) != str(data[2].index.tz)
+    assert combined.index.names == ['DEVICE', 'TIME']
+    assert len(combined) == sum(len(df) for df in data.values())
+    assert str(combined.index.get_level_values('TIME').tz) == 'UTC'
+    for id in ids:
+        assert combined.loc[id].index.equals(data[id].index.tz_convert('UTC'))
+
+def test_fleet_refresh(api, monkeypatch):
+    ids = [1, 2, 3]
+    devices = [SCDevice(id, check_postprocessing = False) for id in ids]
+
+    def load(self, conditional = False):
+        raise AssertionError('Blocking metadata request in get_fleet_data')
+
+    # Stale metadata is refreshed with aiohttp
+    monkeypatch.setattr(config, '_metadata_max_age', 0)
+    monkeypatch.setattr(SCDevice, '__load__', load)
+    requests = api.get_counts()['requests']
+
+    data = asyncio.run(get_fleet_data(devices, min_date = '2024-01-01T00:00:00Z', frequency = '1H'))
+
+    assert set(data) == set(ids)
+    assert api.get_counts()['requests'] - requests == len(ids) * (1 + len(devices[0].json.data.sensors))
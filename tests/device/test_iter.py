@@ -0,0 +1,28 @@
+import pytest
+from smartcitizen_connector import SCDevice
+from smartcitizen_connector._config import config
+from pandas import concat
+import asyncio
+
+def test_iter_data(api, monkeypatch):
+    # Three windows per sensor
+    monkeypatch.setattr(config, '_max_rows_per_request', 500)
+    frequency = '1Min'
+    min_date = '2024-01-01T00:00:00Z'
+
+    d = SCDevice(1)
+
+    async def collect():
+        return [df async for df in d.iter_data(min_date = min_date,
+            frequency = frequency, buffer_size = 1)]
+
+    frames = asyncio.run(collect())
+
+    assert d.data.empty
+    assert all(len(df.columns) == 1 for df in frames)
+    assert len(frames) == 3 * len(d.json.data.sensors)
+
+    asyncio.run(d.get_data(min_date = min_date, frequency = frequency))
+    for column in d.data.columns:
+        streamed = concat([df for df in frames if df.columns[0] == column]).sort_index()
+        assert streamed[column].equals(d.data[column].dropna())
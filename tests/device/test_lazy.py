@@ -0,0 +1,28 @@
+import pytest
+from smartcitizen_connector import SCDevice
+
+def test_lazy(api):
+    id = 1
+
+    d = SCDevice(id, lazy = True)
+    s = SCDevice(id)
+
+    assert '_blueprint' not in d.__dict__
+    assert d.blueprint == s.blueprint
+    assert d.channels == s.channels
+    assert d.hardware_postprocessing == s.hardware_postprocessing
+    assert d.properties == s.properties
+
+def test_lazy_error(api, monkeypatch):
+    def fail(self):
+        raise AttributeError('invalid hardware postprocessing')
+
+    d = SCDevice(1, lazy = True)
+    with monkeypatch.context() as m:
+        m.setattr(SCDevice, '__check_blueprint__', fail)
+        # The error of the resolution, not a missing blueprint attribute
+        with pytest.raises(AttributeError, match = 'invalid hardware postprocessing'):
+            d.blueprint
+
+    # Resolved again on next access
+    assert d.blueprint is None
@@ -0,0 +1,43 @@
+import pytest
+from smartcitizen_connector import SCDevice
+import asyncio
+
+@pytest.fixture
+def device(api, monkeypatch):
+    monkeypatch.setenv('SC_BEARER', 'token')
+    d = SCDevice(1, check_postprocessing = False)
+    # 100 readings of 5 sensors
+    asyncio.run(d.get_data(min_date = '2024-01-01 00:00', max_date = '2024-01-01 01:39'))
+    return d
+
+def post(api, device, **kwargs):
+    # Returns the result, the POST requests and the posted readings
+    api.reset_counts()
+    post_ok = asyncio.run(device.post_data(**kwargs))
+    counts = api.get_counts()
+    return post_ok, counts['requests'], counts['posted']
+
+@pytest.mark.parametrize('combined', [False, True])
+def test_post(api, device, combined):
+    # 10 chunks of 10 rows (x 5 sensors if combined, or per sensor)
+    kwargs = dict(chunk_size = 10, max_chunks_in_flight = 2, combined = combined, max_values = 50)
+    chunks = 10 if combined else 50
+
+    api.configure(latency = 0.01)
+    assert post(api, device, **kwargs) == (True, chunks, 500)
+    assert api.get_counts()['max_in_flight'] == 2
+
+    # Retried
+    api.configure(post_status = 500, post_failures = 1)
+    assert post(api, device, **kwargs) == (True, chunks + 1, 500)
+
+def test_post_failure(api, device):
+    name = device.json.data.sensors[0].name
+    api.configure(latency = 0.01, post_status = 500)
+
+    # Only the 2 chunks in flight are posted (and retried), the rest are not started
+    assert post(api, device, columns = [name], chunk_size = 10,
+        max_chunks_in_flight = 2, max_retries = 3) == (False, 2 * 3, 0)
+    assert post(api, device, chunk_size = 10, max_chunks_in_flight = 2,
+        max_retries = 3, combined = True, max_values = 50) == (False, 2 * 3, 0)
+
@@ -0,0 +1,37 @@
+import pytest
+from smartcitizen_connector import SCDevice
+from smartcitizen_connector._config import config
+from smartcitizen_connector.client import client
+import asyncio
+
+def test_refresh(api, monkeypatch):
+    monkeypatch.setattr(config, '_metadata_max_age', 0)
+    d = SCDevice(1, check_postprocessing = False)
+
+    async def refresh():
+        async with client.async_session() as session:
+            return await d.__async_refresh__(session, asyncio.Semaphore(1))
+
+    def parse(self, payload):
+        raise AssertionError('Unchanged device parsed again')
+
+    # Stale but unchanged: revalidated (304), not parsed
+    not_modified = api.get_counts()['not_modified']
+    with monkeypatch.context() as m:
+        m.setattr(SCDevice, '__parse__', parse)
+        assert d.__refresh__() is False
+        assert asyncio.run(refresh()) is False
+        # Only by Last-Modified
+        d._etag = None
+        assert d.__refresh__() is False
+    assert api.get_counts()['not_modified'] == not_modified + 3
+
+    # Changed
+    last_reading_at = d.json.last_reading_at
+    api.configure(rows = 2880)
+    assert d.__refresh__() is True
+    assert d.json.last_reading_at > last_reading_at
+
+    api.configure(rows = 4320)
+    assert asyncio.run(refresh()) is True
+    assert d.__refresh__() is False
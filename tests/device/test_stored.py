@@ -0,0 +1,66 @@
+import pytest
+from smartcitizen_connector import SCDevice
+from smartcitizen_connector.store import ReadingsStore
+from smartcitizen_connector._config import config
+import asyncio
+
+def test_stored_gap(api, tmp_path):
+    pytest.importorskip('pyarrow')
+
+    store = ReadingsStore(str(tmp_path))
+    d = SCDevice(1, check_postprocessing = False)
+    channels = [d.json.data.sensors[0].name]
+
+    def get_data(min_date, max_date, store = store):
+        asyncio.run(d.get_data(min_date = min_date, max_date = max_date,
+            channels = channels, store = store))
+        return d.data
+
+    # Late range, then early range, then the gap between them
+    get_data('2024-01-01 12:00', '2024-01-01 14:00')
+    get_data('2024-01-01 02:00', '2024-01-01 04:00')
+
+    requests = api.get_counts()['requests']
+    gap = get_data('2024-01-01 06:00', '2024-01-01 07:00')
+    assert api.get_counts()['requests'] > requests
+    assert gap.shape == (61, 1)
+    assert gap.equals(get_data('2024-01-01 06:00', '2024-01-01 07:00', store = None))
+
+    # Everything is covered now
+    requests = api.get_counts()['requests']
+    df = get_data('2024-01-01 02:00', '2024-01-01 14:00')
+    assert api.get_counts()['requests'] > requests
+    assert len(df) == 12 * 60 + 1
+
+    requests = api.get_counts()['requests']
+    assert get_data('2024-01-01 02:00', '2024-01-01 14:00').equals(df)
+    assert api.get_counts()['requests'] == requests
+
+def test_stored_failure(api, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(config, '_retry_interval', 0)
+
+    store = ReadingsStore(str(tmp_path))
+    d = SCDevice(1, check_postprocessing = False)
+    channels = [d.json.data.sensors[0].name]
+
+    def get_data(min_date, max_date):
+        asyncio.run(d.get_data(min_date = min_date, max_date = max_date,
+            channels = channels, store = store))
+        return d.data
+
+    get_data('2024-01-01 02:00', '2024-01-01 04:00')
+
+    # The missing range fails: only the stored readings are returned
+    api.configure(readings_status = 500)
+    assert len(get_data('2024-01-01 02:00', '2024-01-01 06:00')) == 2 * 60 + 1
+
+    # And it is requested again once the API recovers
+    api.configure(readings_status = 200)
+    requests = api.get_counts()['requests']
+    assert len(get_data('2024-01-01 02:00', '2024-01-01 06:00')) == 4 * 60 + 1
+    assert api.get_counts()['requests'] > requests
+
+    requests = api.get_counts()['requests']
+    get_data('2024-01-01 02:00', '2024-01-01 06:00')
+    assert api.get_counts()['requests'] == requests
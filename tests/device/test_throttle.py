@@ -0,0 +1,16 @@
+import pytest
+from smartcitizen_connector import get_fleet_data
+from smartcitizen_connector._config import config
+import asyncio
+
+def test_throttled_fleet(api, monkeypatch):
+    monkeypatch.setattr(config, '_retry_interval', 1)
+    # 429 without a usable Retry-After
+    api.configure(throttle = 5, retry_after = 0)
+    ids = list(range(1, 6))
+
+    data = asyncio.run(get_fleet_data(ids, min_date = '2024-01-01'))
+
+    assert api.get_counts()['throttled'] > 0
+    assert set(data) == set(ids)
+    assert all(df.shape == (1440, 5) for df in data.values())
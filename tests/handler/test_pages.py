@@ -0,0 +1,13 @@
+import pytest
+from smartcitizen_connector.handler.httphandler import get_page_urls
+
+def test_get_page_urls():
+    url = 'https://api.smartcitizen.me/v0/devices/?per_page=100&page='
+
+    urls = get_page_urls({'next': f'{url}2', 'last': f'{url}5'})
+
+    assert urls == [f'{url}{page}' for page in range(2, 6)]
+    assert get_page_urls({'next': f'{url}2'}) is None
+    assert get_page_urls({'last': f'{url}5'}) is None
+    assert get_page_urls({'next': 'https://api.smartcitizen.me/v0/devices/?cursor=a',
+        'last': f'{url}5'}) is None
@@ -0,0 +1,15 @@
+import pytest
+from smartcitizen_connector import paginate
+from smartcitizen_connector.models import Device
+from smartcitizen_connector._config import config
+from itertools import islice
+
+def test_paginate(api):
+    api.configure(devices = 250, per_page = 100)
+
+    devices = list(islice(paginate(config.DEVICES_URL, Device), 150))
+
+    assert len(devices) == 150
+    assert all(isinstance(device, Device) for device in devices)
+    assert [device.id for device in devices] == list(range(1, 151))
+    assert len(list(paginate(config.DEVICES_URL, Device))) == 250
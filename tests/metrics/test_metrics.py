@@ -0,0 +1,35 @@
+import pytest
+from smartcitizen_connector.metrics import metrics, measure, get_endpoint, MetricsAggregator
+
+def test_get_endpoint():
+    assert get_endpoint('https://api.smartcitizen.me/v0/devices/1234/readings?sensor_id=1') == '/v0/devices/{id}/readings'
+    assert get_endpoint('https://api.smartcitizen.me/v0/devices/?page=2') == '/v0/devices/'
+
+def test_measure():
+    url = 'https://api.smartcitizen.me/v0/devices/1/readings'
+    with metrics.collect() as aggregator:
+        for n in range(10):
+            with measure('GET', url) as event:
+                # Nested measures of the same request fill the same event
+                with measure('GET', url) as inner:
+                    assert inner is event
+                    event.latency = n
+                    event.bytes = 100
+                with event.timing('parse_time'):
+                    pass
+
+        with pytest.raises(ValueError):
+            with measure('POST', url):
+                raise ValueError
+
+    summary = aggregator.summary()
+    get = summary['GET /v0/devices/{id}/readings']
+    assert get['count'] == 10
+    assert get['bytes'] == 1000
+    assert get['latency'] == 45
+    assert get['latency_p50'] == 4.5
+    assert get['latency_p95'] == pytest.approx(8.55)
+    assert get['parse_time'] > 0
+    assert summary['POST /v0/devices/{id}/readings']['errors'] == 1
+    assert aggregator.totals()['count'] == 11
+    assert aggregator not in metrics.callbacks
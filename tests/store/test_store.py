@@ -0,0 +1,34 @@
+import pytest
+from smartcitizen_connector.store import ReadingsStore, missing_ranges
+from pandas import DataFrame, Timestamp, date_range, to_datetime
+
+def test_store(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    store = ReadingsStore(str(tmp_path))
+    df = DataFrame({'value': [1.0, 2.0, 3.0]},
+        index = date_range('2024-01-01', periods = 3, freq = 'min', tz = 'UTC'))
+    coverage = [{'from': to_datetime('2024-01-01', utc = True), 'to': df.index[-1]}]
+
+    assert store.load(1, 2, '1m') == (None, None)
+
+    store.save(1, 2, '1m', df, coverage)
+    stored, stored_coverage = store.load(1, 2, '1m')
+
+    assert stored.equals(df)
+    assert stored_coverage == coverage
+
+    store.clear(1)
+    assert store.load(1, 2, '1m') == (None, None)
+
+def test_missing_ranges():
+    t = lambda hour: Timestamp(f'2024-01-01 {hour:02d}:00', tz = 'UTC')
+    coverage = [{'from': t(12), 'to': t(14)}, {'from': t(2), 'to': t(4)}]
+
+    assert missing_ranges([], t(0), t(1)) == [(t(0), t(1))]
+    assert missing_ranges(coverage, t(3), t(13)) == [(t(4), t(12))]
+    assert missing_ranges(coverage, t(0), t(20)) == [(t(0), t(2)), (t(4), t(12)), (t(14), t(20))]
+    assert missing_ranges(coverage, t(2), t(4)) == []
+    assert missing_ranges(coverage, t(13), None) == [(t(14), None)]
+    # Adjoining ranges are merged
+    assert missing_ranges(coverage + [{'from': t(4), 'to': t(12)}], t(2), t(14)) == []
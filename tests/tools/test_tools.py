@@ -0,0 +1,124 @@
+import pytest
+from smartcitizen_connector.tools import split_time_windows, convert_rollup_to_seconds, combine_frames, \
+    make_readings_payload, split_chunks, get_timezone, timezone_at, parse_readings, merge_readings, \
+    parse_timestamps, compact_frame, get_memory_usage, retry_interval
+from smartcitizen_connector._config import config
+from pandas import Timestamp, DataFrame, date_range
+
+def test_split_time_windows():
+    min_date = Timestamp('2024-01-01', tz = 'UTC')
+    max_date = Timestamp('2024-01-02 01:00', tz = 'UTC')
+
+    windows = split_time_windows(min_date, max_date, '1m', 600)
+
+    assert convert_rollup_to_seconds('10m') == 600
+    assert convert_rollup_to_seconds('1ms') == 0.001
+    assert len(windows) == 3
+    assert windows[0][0] == min_date
+    assert windows[-1][1] == max_date
+    assert all(windows[i][1] == windows[i+1][0] for i in range(len(windows) - 1))
+    assert split_time_windows(min_date, max_date, '1M', 600) == [(min_date, max_date)]
+
+    windows = split_time_windows(Timestamp('2019-01-01 00:00:00.5', tz = 'UTC'), max_date, '1m', 10000, 16)
+    assert len(windows) == 16
+    assert windows[-1][1] == max_date
+
+def test_combine_frames():
+    index = date_range('2024-01-01', periods = 6, freq = 'min', tz = 'UTC')
+    frames = [
+        DataFrame({'B': [1, 2, None, 4, 5, 6]}, index = index),
+        None,
+        DataFrame({'A': [1, 2]}, index = index[4:]),
+        DataFrame({'B': [9, 9, 9]}, index = index[1:4])
+    ]
+
+    expected = DataFrame()
+    for frame in frames:
+        if frame is None: continue
+        expected = expected.combine_first(frame)
+
+    assert combine_frames(frames).equals(expected)
+    assert combine_frames([]).empty
+
+def test_parse_readings():
+    readings = [['2024-01-01T00:02:00Z', 3], ['2024-01-01T00:01:00Z', 2],
+        ['2024-01-01T00:01:00Z', 9], ['2024-01-01T00:00:00Z', 1]]
+
+    timestamps, values = parse_readings(readings)
+
+    assert list(timestamps) == [Timestamp(f'2024-01-01 00:0{i}', tz = 'UTC').value for i in range(3)]
+    assert list(values) == [1.0, 2.0, 3.0]
+    assert values.dtype == float
+
+    timestamps, values = merge_readings([(timestamps[:2], values[:2]),
+        parse_readings([['2024-01-01T00:01:00Z', 5], ['2024-01-01T00:03:00Z', 4]])])
+    assert list(values) == [1.0, 2.0, 4.0]
+
+def test_parse_timestamps():
+    dates = ['2024-03-31T00:30:00Z', '2024-03-31T01:00:00Z']
+    expected = [Timestamp(date).value for date in dates]
+
+    assert list(parse_timestamps(dates)) == expected
+    # Other formats fall back to pandas
+    assert list(parse_timestamps(['2024-03-31T01:30:00+01:00', dates[1]])) == expected
+    assert list(parse_timestamps(['2024-03-31T00:30:00.000Z'])) == expected[:1]
+
+def test_compact_frame():
+    index = date_range('2024-01-01', periods = 100, freq = 'min', tz = 'UTC')
+    df = DataFrame({'fast': range(100), 'slow': [1.0 if i % 10 == 0 else None for i in range(100)],
+        'name': ['a'] * 100}, index = index)
+    df['fast'] = df['fast'].astype(float)
+
+    compact = compact_frame(df)
+    assert compact.dtypes.astype(str).tolist()[:2] == ['float32', 'float32']
+    assert compact['name'].dtype == df['name'].dtype
+
+    sparse = compact_frame(df, sparse = True)
+    assert str(sparse['slow'].dtype) == 'Sparse[float32, nan]'
+    assert str(sparse['fast'].dtype) == 'float32'
+    assert sparse['slow'].sparse.to_dense().equals(compact['slow'])
+    assert get_memory_usage(sparse) < get_memory_usage(compact) < get_memory_usage(df)
+
+def test_retry_interval():
+    # The rate limiter waits for Retry-After, otherwise the retry waits
+    assert retry_interval(429, {'Retry-After': '2'}) == 0
+    assert retry_interval(429, {'Retry-After': '0'}) == config._retry_interval
+    assert retry_interval(429) == config._retry_interval
+    assert retry_interval(503, {'Retry-After': '2'}) == config._retry_interval
+
+def test_make_readings_payload():
+    index = date_range('2024-03-31 00:30', periods = 4, freq = '30min', tz = 'Europe/Madrid')
+    df = DataFrame({12: [1.5, None, 3.0, None], 45: [1, 2, 3, 4]}, index = index)
+
+    payload = make_readings_payload(df)
+
+    assert payload['data'][0] == {'recorded_at': '2024-03-30T23:30:00Z',
+        'sensors': [{'id': 12, 'value': 1.5}, {'id': 45, 'value': 1}]}
+    assert payload['data'][1]['sensors'] == [{'id': 45, 'value': 2}]
+    assert [item['recorded_at'] for item in payload['data']] == \
+        [item.strftime('%Y-%m-%dT%H:%M:%SZ') for item in index.tz_convert('UTC')]
+
+def test_split_chunks():
+    index = date_range('2024-01-01', periods = 10, freq = 'min', tz = 'UTC')
+    df = DataFrame({1: range(10), 2: [None, 1] * 5, 3: range(10)}, index = index)
+
+    assert [len(chunk) for chunk in split_chunks(df, 4)] == [4, 4, 2]
+
+    chunks = split_chunks(df, 4, max_values = 5)
+    assert all(chunk.notna().sum().sum() <= 5 for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) == len(df)
+    assert [len(chunk) for chunk in split_chunks(df, 4, max_values = 1)] == [1] * 10
+
+def test_get_timezone():
+    timezone_at.cache_clear()
+
+    assert get_timezone(41.39689, 2.19468) == 'Europe/Madrid'
+    assert get_timezone(41.396891, 2.194681) == 'Europe/Madrid'
+    assert timezone_at.cache_info().hits == 1
+    assert get_timezone(None, 2.19468) is None
+
+def test_tf():
+    from smartcitizen_connector.tools import tf, get_timezone_finder
+
+    assert tf is get_timezone_finder()
+    assert tf.timezone_at(lng = 2.19468, lat = 41.39689) == 'Europe/Madrid'